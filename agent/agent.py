@@ -1,15 +1,31 @@
-import pdfplumber
 import colorlog
 import logging
 from mistralai import Mistral
+from cache import DiskCache, llm_cache_key
+from decks import DeckStore, document_key, subject_key
+from grading import answer_similarity
+from metrics import metrics
+from parsing import match_format, parse_json_object, split_terms
+from pdf_extract import extract_pdf_text
+from repetition import RepetitionScheduler
+from router import ModelRouter
+from similarity import closest_definitions, mask_terms, pick_distractors
+from scheduler import (PRIORITY_PREFETCH, PRIORITY_SETUP, MistralScheduler, is_rate_limited,
+                       llm_priority)
+from sessions import Session, create_session_store
+from terms import estimate_tokens, parse_term_lines, rank_terms, split_into_chunks, spread_sample
 
 import os
 import random
+import asyncio
+import json
+import math
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
 logger = logging.getLogger("agent")  # log agent messages
-logger.setLevel(logging.ERROR)
+logger.setLevel(os.getenv("AGENT_LOG_LEVEL", "ERROR").upper())
 logging.basicConfig(level=logging.DEBUG)
 console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
@@ -30,16 +46,150 @@ logger.addHandler(console_handler)
 
 
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
-MISTRAL_MODEL = "mistral-large-latest"
+PREFETCH_DEPTH = 2  # how many upcoming questions to build in the background
+DECK_BATCH_SIZE = 10  # terms per batched deck request
+# Where Multiple Choice distractors come from: "deck" uses the most similar definitions of the
+# session's other terms, asking the LLM only when there are too few; "llm" generates them per term.
+DISTRACTOR_SOURCE = os.getenv("DISTRACTOR_SOURCE", "deck")
+DECK_DISTRACTOR_MIN_TERMS = 7  # so each question draws its 3 distractors from at least 6 definitions
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./cache/llm.sqlite3")
+LLM_CACHE_MAX_ENTRIES = 50_000
+LLM_CACHE_TTL = 7 * 24 * 3600  # seconds
+DOCUMENT_CACHE_PATH = os.getenv("DOCUMENT_CACHE_PATH", "./cache/documents.sqlite3")
+DOCUMENT_CACHE_MAX_ENTRIES = 2_000
+DOCUMENT_CACHE_TTL = 30 * 24 * 3600  # seconds
+# Free Response answers scoring at or above this against the reference definition are accepted
+# locally; the rest go to the LLM, since a paraphrase can share no words with the reference at all.
+GRADE_ACCEPT_THRESHOLD = float(os.getenv("GRADE_ACCEPT_THRESHOLD", "0.75"))
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "500"))
+MAX_PDF_CHARS = int(os.getenv("MAX_PDF_CHARS", "2000000"))  # text budget per document
+REVIEW_SESSION_SIZE = 10  # due cards in a "review" session
+TERM_CHUNK_TOKENS = 6000  # approximate tokens of document text per term-extraction request
+MAX_TERM_CHUNK_TOKENS = 24000  # chunks grow up to this so a long document fits in one round of calls
+MAX_TERM_CHUNKS = 32  # longer documents take further rounds up to this many chunks, then are sampled evenly
 
 
 class StudyAgent:
 
-    def __init__(self):
-        self.sessions = {}
+    def __init__(self, session_store=None, decks=None):
+        self.sessions = session_store or create_session_store()
+        self.prefetches = {}  # user_id -> {term index: asyncio.Task}
+        self.deck_compiles = {}  # user_id -> asyncio.Task of a compile_deck running in the background
         self.mistral = Mistral(api_key=MISTRAL_API_KEY)
+        self.scheduler = MistralScheduler()
+        self.router = ModelRouter()
+        self.repetition = RepetitionScheduler()
+        self.decks = decks or DeckStore()
+        self.llm_cache = DiskCache(LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL)
+        # Extracted text and terms of uploaded PDFs, keyed by the SHA-256 of the file
+        self.document_cache = DiskCache(
+            DOCUMENT_CACHE_PATH, max_entries=DOCUMENT_CACHE_MAX_ENTRIES, ttl=DOCUMENT_CACHE_TTL)
+        self.pdf_extractions = {}  # document_hash -> asyncio.Task of an extraction in progress
+        self.grading_stats = {"local": 0, "llm": 0}
+        metrics.gauge("llm_cache_hit_ratio", self.llm_cache.hit_rate)
+        metrics.gauge("document_cache_hit_ratio", self.document_cache.hit_rate)
+        metrics.gauge("local_grading_ratio", self.local_grading_rate)
+
+    async def complete(self, messages, model=None, cache=True, priority=None, call_site="other", **options):
+        """Runs a chat completion and returns the stripped reply text.
+
+        Without a model, the router picks one for call_site and falls back to a smaller model if
+        it is too slow. With cache=True the reply is looked up by (model or call_site, normalized
+        prompt, options) first and stored after a successful call, so repeated prompts skip the
+        round trip; replies from a model below call_site's quality tier are not stored. Calls that do go out are queued by the scheduler at priority (by default the
+        current llm_priority). Latency, tokens and errors are recorded in metrics under call_site
+        and model.
+        """
+        key = llm_cache_key(model or call_site, messages, **options) if cache else None
+        if key:
+            cached = self.llm_cache.get(key)
+            metrics.inc("llm_cache_lookups_total", call_site=call_site, result="miss" if cached is None else "hit")
+            if cached is not None:
+                return cached
+
+        routed = model is None
+        served = model
+
+        async def call(model, timeout=None):
+            nonlocal served
+            served = model
+
+            async def request():
+                # Runs once the scheduler has granted a slot, so the router only sees model latency
+                started = time.perf_counter()
+                response = await self.mistral.chat.complete_async(model=model, messages=messages, **options)
+                if routed:
+                    self.router.observe(call_site, model, time.perf_counter() - started)
+                return response
+
+            response = await self.run_llm(model, request, priority, call_site, timeout)
+            self.record_usage(getattr(response, "usage", None), model, call_site)
+            return response
+
+        response = await (self.router.call(call_site, call) if routed else call(model))
+        content = response.choices[0].message.content.strip()
+        if key and (not routed or self.router.meets_tier(call_site, served)):
+            self.llm_cache.set(key, content)
+        return content
+
+    async def stream_complete(self, messages, on_partial, model=None, priority=None, call_site="other", **options):
+        """Like complete(), but streams the reply and calls on_partial(text so far) as tokens arrive.
+
+        Streamed replies are never cached, and are not retried on a fallback model once they have
+        started. The scheduler slot is held until the stream ends.
+        """
+        routed = model is None
+        model = model or self.router.choose(call_site)
+        started = time.perf_counter()
+
+        async def consume():
+            requested = time.perf_counter()
+            parts = []
+            usage = None
+            stream = await self.mistral.chat.stream_async(model=model, messages=messages, **options)
+            async for event in stream:
+                chunk = event.data
+                usage = chunk.usage or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if isinstance(delta, str) and delta:
+                    if not parts:
+                        metrics.observe("llm_first_token_seconds", time.perf_counter() - started,
+                                        call_site=call_site, model=model)
+                    parts.append(delta)
+                    on_partial("".join(parts).strip())
+            if routed:
+                self.router.observe(call_site, model, time.perf_counter() - requested)
+            return "".join(parts).strip(), usage
+
+        content, usage = await self.run_llm(model, consume, priority, call_site)
+        self.record_usage(usage, model, call_site)
+        return content
+
+    async def run_llm(self, model, call, priority, call_site, timeout=None):
+        """scheduler.run() with latency and errors recorded in metrics under call_site and model."""
+        started = time.perf_counter()
+        try:
+            return await self.scheduler.run(model, call, priority, timeout)
+        except Exception as e:
+            metrics.inc("llm_errors_total", call_site=call_site, model=model, error=type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe("llm_call_seconds", elapsed, call_site=call_site, model=model)
+            logger.debug(f"{call_site} ({model}) took {elapsed:.2f}s")
+
+    def record_usage(self, usage, model, call_site):
+        if usage is not None:
+            metrics.inc("llm_tokens_total", usage.prompt_tokens or 0, call_site=call_site, model=model, kind="prompt")
+            metrics.inc("llm_tokens_total", usage.completion_tokens or 0, call_site=call_site, model=model,
+                        kind="completion")
+
+    async def extract_terms_and_subject(self, user_message):
+        # A plain comma-separated list (what !help asks for) needs no LLM call
+        terms = split_terms(user_message)
+        if terms:
+            return {"terms": terms, "subject": ""}
 
-    def extract_terms_and_subject(self, user_message):
         prompt = f"""
         Extract the study terms and subject from the following user message:
         {user_message}
@@ -52,42 +202,58 @@ class StudyAgent:
 
         try:
             messages = [{"role": "user", "content": prompt}]
-            response = self.mistral.chat.complete(
-                model="mistral-tiny",
-                messages=messages
-            )
-            extracted_data = response.choices[0].message.content.strip()
-            return eval(extracted_data)  # Convert JSON string to dict
+            extracted_data = parse_json_object(await self.complete(messages, call_site="extract_terms"))
+            terms = extracted_data.get("terms")
+            subject = extracted_data.get("subject")
+            return {
+                "terms": [str(t).strip() for t in terms if str(t).strip()] if isinstance(terms, list) else [],
+                "subject": subject if isinstance(subject, str) else ""
+            }
         except Exception as e:
             logger.error(f"Error extracting terms and subject: {str(e)}")
             return {"terms": [], "subject": ""}
 
-    def start_session(self, user_id, user_message, subject=None):
-        if user_id in self.sessions and "terms" in self.sessions[user_id]:
-            session = self.sessions[user_id]
-            terms = session["terms"]
-            subject = session.get("subject", "")
+    async def start_session(self, user_id, user_message, subject=None):
+        session = self.sessions.get(user_id)
+        if session and session.terms:
+            terms = session.terms
+            subject = session.subject
         else:
-            if subject:
-                terms = self.generate_terms_from_subject(subject)
+            # Keep any pending PDF upload on the session
+            session = session or Session()
+            if user_message.strip().lower() == "review":
+                terms = self.repetition.due_terms(user_id, REVIEW_SESSION_SIZE)
+                if not terms:
+                    return "✅ Nothing is due for review right now. Send some terms to study something new!"
+                subject = "review"
+                session.terms, session.current_term, session.subject = terms, 0, subject
+            elif deck := self.decks.load(subject_key(subject or user_message)):
+                # A precompiled deck: every card is ready, so no LLM calls are needed
+                terms = [card["term"] for card in deck["cards"]]
+                random.shuffle(terms)
+                terms = self.repetition.order_terms(user_id, terms)
+                subject = deck["subject"]
+                session.terms, session.current_term, session.subject = terms, 0, subject
+                session.deck = self.precompiled_cards(deck, terms)
+            elif subject:
+                terms = await self.generate_terms_from_subject(subject)
                 if not terms:
                     return "⚠️ I couldn't generate any study terms for the given subject."
-                self.sessions[user_id] = {
-                    "terms": terms, "current_term": 0, "subject": subject}
+                session.terms, session.current_term, session.subject = terms, 0, subject
             else:
-                extracted = self.extract_terms_and_subject(user_message)
+                extracted = await self.extract_terms_and_subject(user_message)
                 terms = extracted.get("terms", [])
                 subject = extracted.get("subject", "")
                 if not terms:
                     return "⚠️ I couldn't extract any study terms. Please list them clearly."
 
                 random.shuffle(terms)  # Randomize the order of terms
-                self.sessions[user_id] = {
-                    "terms": terms, "current_term": 0, "subject": subject}
-
+                # Then put the cards due for review first
+                terms = self.repetition.order_terms(user_id, terms)
+                session.terms, session.current_term, session.subject = terms, 0, subject
 
-
-        self.sessions[user_id]["setup"] = True
+        session.setup = True
+        self.sessions.save(user_id, session)
         confirmation_message = self.generate_custom_confirmation(
             terms, subject)
         format_message = (
@@ -102,7 +268,11 @@ class StudyAgent:
         subject_text = f"{subject}" if subject else ""
         return f"Sounds great! I'll help you quickly study these {subject_text} terms. Let's get started! \n"
 
-    def extract_format(self, user_message):
+    async def extract_format(self, user_message):
+        study_format = match_format(user_message)
+        if study_format:
+            return study_format
+
         prompt = f"""
         Extract the study format from the following user message:
         {user_message}
@@ -115,57 +285,304 @@ class StudyAgent:
 
         try:
             messages = [{"role": "user", "content": prompt}]
-            response = self.mistral.chat.complete(
-                model="mistral-tiny",
-                messages=messages
-            )
-            extracted_data = response.choices[0].message.content.strip()
-            return eval(extracted_data).get("format", "")
+            extracted_data = parse_json_object(await self.complete(messages, call_site="extract_format"))
+            return extracted_data.get("format", "")
         except Exception as e:
             logger.error(f"Error extracting format: {str(e)}")
             return ""
 
-    def set_study_format(self, user_id, user_message):
-        extracted_format = self.extract_format(user_message)
+    async def set_study_format(self, user_id, user_message):
+        extracted_format = await self.extract_format(user_message)
 
-        if user_id not in self.sessions or "setup" not in self.sessions[user_id]:
+        session = self.sessions.get(user_id)
+        if not session or not session.terms:
             return "⚠️ No active study session found. Please start a session first."
 
         if extracted_format not in ["Free Response", "Multiple Choice", "Fill-in-the-Blank"]:
             return "⚠️ Invalid format. Please choose 'Free Response', 'Multiple Choice', or 'Fill-in-the-Blank'."
 
-        session = self.sessions[user_id]
-        session["format"] = extracted_format
-        session["setup"] = False
+        session.format = extracted_format
+        session.setup = False
+        self.sessions.save(user_id, session)
         return f"You have chosen the {extracted_format} format. Let's get started!"
 
     def get_current_term(self, user_id):
         session = self.sessions.get(user_id)
         if not session:
             return None
-        num_questions = session.get('num_questions', len(session["terms"]))
-        return session["terms"][session["current_term"]] if session["current_term"] < num_questions else None
+        return session.terms[session.current_term] if session.current_term < session.question_count else None
 
     def next_term(self, user_id):
         session = self.sessions.get(user_id)
         if not session:
             return None
 
-        num_questions = session.get('num_questions', len(session["terms"]))
-        session["current_term"] += 1
+        session.current_term += 1
 
-        if session["current_term"] >= num_questions:
-            del self.sessions[user_id]
+        if session.current_term >= session.question_count:
+            self.sessions.delete(user_id)
+            self.cancel_prefetches(user_id)
             return None
-        return session["terms"][session["current_term"]]
-    
-    def generate_multiple_choice_question(self, term):
-        question = f"What does '{term}' mean?"
+        self.sessions.save(user_id, session)
+        return session.terms[session.current_term]
+
+    async def generate_question(self, term, study_format, definitions=()):
+        """Builds the question for a term in the given format. Free Response needs no generation.
 
-        correct_answer = self.generate_correct_answer(term)
-        distractors = self.generate_distractors(term)
+        definitions are the other terms' definitions, to draw Multiple Choice distractors from.
+        """
+        if study_format == "Multiple Choice":
+            return await self.generate_multiple_choice_question(term, definitions)
+        if study_format == "Fill-in-the-Blank":
+            return await self.generate_fill_in_the_blank_question(term)
+        return None
+
+    def prefetch_questions(self, user_id, depth=PREFETCH_DEPTH):
+        """Starts building the next few questions in the background while the user answers."""
+        session = self.sessions.get(user_id)
+        if not session or session.format not in ["Multiple Choice", "Fill-in-the-Blank"]:
+            return
+        if user_id in self.deck_compiles:
+            return  # the deck will have these questions
+
+        tasks = self.prefetches.setdefault(user_id, {})
+        start = session.current_term + 1
+        for index in range(start, min(start + depth, session.question_count)):
+            if index not in tasks and not self.get_card(session, index):
+                with llm_priority(PRIORITY_PREFETCH):
+                    tasks[index] = asyncio.create_task(self.generate_question(
+                        session.terms[index], session.format, self.deck_definitions(session)))
+
+    def cancel_prefetches(self, user_id):
+        """Cancels the user's background question work: prefetches and any deck compile."""
+        for task in self.prefetches.pop(user_id, {}).values():
+            task.cancel()
+        task = self.deck_compiles.pop(user_id, None)
+        if task:
+            task.cancel()
+
+    def start_deck_compile(self, user_id):
+        """Runs compile_deck in the background, so the first question doesn't wait for the deck."""
+        with llm_priority(PRIORITY_SETUP):
+            task = asyncio.create_task(self.compile_deck(user_id))
+        self.deck_compiles[user_id] = task
+
+        def done(_):
+            if self.deck_compiles.get(user_id) is task:
+                del self.deck_compiles[user_id]
+
+        task.add_done_callback(done)
+        return task
+
+    async def get_question(self, user_id):
+        """Returns the question for the current term, awaiting its prefetch if one is in flight.
+
+        The first question is built on its own while the deck compiles; later ones wait for the
+        deck if it is still compiling. For Multiple Choice the options and correct index are kept
+        on the session for grading.
+        """
+        session = self.sessions.get(user_id)
+        if not session:
+            return None
+
+        index = session.current_term
+        compiling = self.deck_compiles.get(user_id)
+        if compiling and index > 0 and not self.get_card(session, index):
+            try:
+                await asyncio.shield(compiling)
+            except asyncio.CancelledError:
+                if not compiling.cancelled():
+                    raise  # we were cancelled, not the compile
+            except Exception as e:
+                logger.error(f"Error compiling deck: {e}")  # fall back to building the question alone
+            session = self.sessions.get(user_id) or session
+        card = self.get_card(session, index)
+        if card:
+            question = self.question_from_card(card, session.format, session.terms)
+        else:
+            task = self.prefetches.get(user_id, {}).pop(index, None)
+            # Queue up the following questions before waiting on this one
+            self.prefetch_questions(user_id)
+            if task is not None:
+                question = await task
+            else:
+                question = await self.generate_question(
+                    session.terms[index], session.format, self.deck_definitions(session))
+
+        if session.format == "Multiple Choice":
+            # Re-read the session: it may have been saved by someone else while we waited
+            session = self.sessions.get(user_id) or session
+            session.mcq_options = question["options"]
+            session.correct_answer = question["correct_answer"]
+            self.sessions.save(user_id, session)
+        return question
+
+    async def compile_deck(self, user_id):
+        """Generates every card for the session in a few batched requests and stores them as session.deck.
+
+        Cards already on the session (from a precompiled deck) are kept when they suit the format,
+        and only the missing ones are generated.
+        """
+        session = self.sessions.get(user_id)
+        if not session or not session.format:
+            return []
+
+        terms = session.terms[:session.question_count]
+        cards = {}
+        for raw in session.deck or []:
+            card = self.validate_card(raw, session.format)
+            if card:
+                cards[card["term"].lower()] = card
+        missing = [term for term in terms if term.lower() not in cards]
+        study_format = session.format
+        if study_format == "Multiple Choice" and DISTRACTOR_SOURCE == "deck" and len(terms) >= DECK_DISTRACTOR_MIN_TERMS:
+            study_format = "Free Response"  # definitions only; distractors come from the deck itself
+        batches = [missing[i:i + DECK_BATCH_SIZE] for i in range(0, len(missing), DECK_BATCH_SIZE)]
+        with llm_priority(PRIORITY_SETUP):
+            results = await asyncio.gather(
+                *(self.generate_deck_cards(batch, study_format) for batch in batches))
+
+        for batch_cards in results:
+            cards.update(batch_cards)
+        if study_format != session.format:
+            self.add_deck_distractors(cards, session.terms)
+        # Terms the model skipped stay None and fall back to per-question generation
+        latest = self.sessions.get(user_id)
+        if not latest or latest.terms[:len(terms)] != terms or latest.format != session.format:
+            return []  # the session ended or changed while the deck was compiling
+        session = latest
+        session.deck = [cards.get(term.lower()) for term in terms]
+        self.sessions.save(user_id, session)
+        return session.deck
+
+    async def generate_deck_cards(self, terms, study_format):
+        """Asks for the cards of several terms at once. Returns {lowercased term: card} for the valid ones.
+
+        With study_format None, cards have every field, so they serve any format.
+        """
+        fields = {
+            "Multiple Choice": '"definition": "...", "distractors": ["...", "...", "..."]',
+            "Fill-in-the-Blank": '"sentence": "..."',
+            None: '"definition": "...", "distractors": ["...", "...", "..."], "sentence": "..."',
+        }.get(study_format, '"definition": "..."')
+        prompt = f"""
+        Create study cards for each of these terms: {json.dumps(terms)}
+        - "definition" is an incredibly succinct and short definition, as a complete sentence that
+          doesn't use the term itself.
+        - "distractors" are three succinct definitions that are plausible but wrong.
+        - "sentence" is a fill-in-the-blank sentence with enough context to guess the term, where
+          the term is replaced by '**___**'.
+        Respond in JSON format with one card per term, using the terms exactly as given:
+        {{
+          "cards": [{{"term": "...", {fields}}}, ...]
+        }}
+        """
+
+        try:
+            messages = [{"role": "user", "content": prompt}]
+            data = json.loads(await self.complete(
+                messages, call_site="deck_cards", response_format={"type": "json_object"}))
+        except Exception as e:
+            logger.error(f"Error generating deck cards: {str(e)}")
+            return {}
+
+        requested = {term.lower(): term for term in terms}
+        cards = {}
+        for raw in data.get("cards", []) if isinstance(data, dict) else []:
+            card = self.validate_card(raw, study_format)
+            if card and card["term"].lower() in requested:
+                card["term"] = requested[card["term"].lower()]
+                cards[card["term"].lower()] = card
+        return cards
+
+    def validate_card(self, raw, study_format):
+        """Returns a cleaned card, or None if it is missing what the format needs."""
+        if not isinstance(raw, dict) or not isinstance(raw.get("term"), str):
+            return None
 
-        options = [correct_answer] + distractors
+        card = {"term": raw["term"].strip()}
+        if study_format in ("Fill-in-the-Blank", None):
+            sentence = raw.get("sentence")
+            if not isinstance(sentence, str) or "___" not in sentence:
+                return None
+            card["sentence"] = sentence.strip()
+            if study_format:
+                return card
+
+        definition = raw.get("definition")
+        if not isinstance(definition, str) or not definition.strip():
+            return None
+        card["definition"] = definition.strip()
+
+        if study_format in ("Multiple Choice", None):
+            distractors = raw.get("distractors")
+            if not isinstance(distractors, list):
+                return None
+            distractors = [d.strip() for d in distractors if isinstance(d, str) and d.strip()]
+            if len(distractors) < 3:
+                return None
+            card["distractors"] = distractors[:3]
+        return card
+
+    def add_deck_distractors(self, cards, terms):
+        """Gives each card without distractors the three definitions of other cards most similar to
+        its own, with the session's terms masked out of them. Cards that can't get any are
+        dropped, to be generated per question instead."""
+        keys = list(cards)
+        definitions = [mask_terms(cards[key]["definition"], terms) for key in keys]
+        picks = pick_distractors(definitions) or [None] * len(keys)
+        for key, distractors in zip(keys, picks):
+            if "distractors" not in cards[key]:
+                if distractors:
+                    cards[key]["distractors"] = distractors
+                else:
+                    del cards[key]
+
+    def deck_definitions(self, session):
+        if DISTRACTOR_SOURCE != "deck":
+            return []
+        return [mask_terms(card["definition"], session.terms)
+                for card in session.deck or [] if card and card.get("definition")]
+
+    def precompiled_cards(self, deck, terms):
+        """A precompiled deck's cards for terms, in the same order."""
+        cards = {card["term"].lower(): card for card in deck["cards"]}
+        return [cards.get(term.lower()) for term in terms]
+
+    def get_card(self, session, index):
+        deck = session.deck or []
+        return deck[index] if index < len(deck) else None
+
+    def question_from_card(self, card, study_format, terms=()):
+        if study_format == "Multiple Choice":
+            return self.build_multiple_choice_question(
+                card["term"], mask_terms(card["definition"], terms), card["distractors"])
+        if study_format == "Fill-in-the-Blank":
+            return card["sentence"]
+        return None
+
+    async def generate_multiple_choice_question(self, term, definitions=()):
+        """With enough other definitions, only the correct answer is generated, and the distractors
+        are the definitions most similar to it."""
+        if len(definitions) >= DECK_DISTRACTOR_MIN_TERMS - 1:
+            correct_answer = await self.generate_correct_answer(term)
+            distractors = closest_definitions(correct_answer, definitions)
+            if distractors:
+                return self.build_multiple_choice_question(term, correct_answer, distractors)
+            return self.build_multiple_choice_question(term, correct_answer, await self.generate_distractors(term))
+
+        # Both calls only depend on the term, so run them side by side
+        correct_answer, distractors = await asyncio.gather(
+            self.generate_correct_answer(term),
+            self.generate_distractors(term)
+        )
+        return self.build_multiple_choice_question(term, correct_answer, distractors)
+
+    def build_multiple_choice_question(self, term, correct_answer, distractors):
+        question = f"What does '{term}' mean?"
+        # An option that names the term would give the answer away
+        correct_answer = mask_terms(correct_answer, [term])
+        options = [correct_answer] + [mask_terms(distractor, [term]) for distractor in distractors]
         logging.debug(f"Options before shuffle: {options}")
 
         random.shuffle(options)
@@ -180,31 +597,23 @@ class StudyAgent:
         }
 
 
-    def generate_correct_answer(self, term):
+    async def generate_correct_answer(self, term):
         prompt = f"Generate an incredibly succinct and short definition for the term '{term}'. Make it a complete sentence."
         try:
             messages = [{"role": "user", "content": prompt}]
-            response = self.mistral.chat.complete(
-                model="mistral-tiny",
-                messages=messages
-            )
-            return response.choices[0].message.content.strip()
+            return await self.complete(messages, call_site="correct_answer")
         except Exception as e:
             logging.error(f"Error generating correct answer: {str(e)}")
             return "Correct definition not available."
 
-    def generate_distractors(self, term):
+    async def generate_distractors(self, term):
         prompt = f"""Generate three succinct and incorrect definitions for the term '{term}'.
 Each should be plausible but wrong. 
 Return only the definitions as plain text, each on a new line. 
 Do NOT number them or include any list formatting (e.g., no dashes, no bullets)."""
         try:
             messages = [{"role": "user", "content": prompt}]
-            response = self.mistral.chat.complete(
-                model="mistral-tiny",
-                messages=messages
-            )
-            response_text = response.choices[0].message.content.strip()
+            response_text = await self.complete(messages, call_site="distractors")
 
             # Ensure clean output by stripping unwanted characters
             distractors = [d.strip("-•1234567890. ") for d in response_text.split("\n") if d.strip()]
@@ -217,7 +626,7 @@ Do NOT number them or include any list formatting (e.g., no dashes, no bullets).
             return ["Incorrect definition 1", "Incorrect definition 2", "Incorrect definition 3"]
 
 
-    def generate_fill_in_the_blank_question(self, term):
+    async def generate_fill_in_the_blank_question(self, term):
         prompt = f"""
         Generate a fill-in-the-blank sentence where the blank is the term '{term}'. The sentence 
         should provide enough context that the user can reasonably guess the correct term. Return
@@ -226,43 +635,56 @@ Do NOT number them or include any list formatting (e.g., no dashes, no bullets).
         """
         try:
             messages = [{"role": "user", "content": prompt}]
-            response = self.mistral.chat.complete(
-                model="mistral-tiny", messages=messages
-            )
-            sentence = response.choices[0].message.content.strip()
+            sentence = await self.complete(messages, call_site="fill_in_the_blank")
             return sentence
         except Exception as e:
             logging.error(
                 f"Error generating fill-in-the-blank sentence: {str(e)}")
             return f"___ is an important term in this topic."
 
-    def check_answer(self, user_id, term, user_answer, mcq_questions=None, correct_index=None):
+    async def check_answer(self, user_id, term, user_answer, mcq_questions=None, correct_index=None,
+                           on_partial=None):
+        """Grades an answer and returns the feedback.
+
+        When Free Response feedback comes from the LLM and on_partial is given, the feedback is
+        streamed and on_partial(text so far) is called as it arrives, verdict first.
+        """
         session = self.sessions.get(user_id)
 
         if not session:
             return "⚠️ No active study session found."
 
         try:
-            if session["format"] == "Multiple Choice" and mcq_questions:
-                print("WHAT", mcq_questions)
+            if session.format == "Multiple Choice" and mcq_questions:
                 if user_answer.isdigit() and 1 <= int(user_answer) <= len(mcq_questions):
                     user_answer_index = int(user_answer) - 1  # Convert to 0-based index
                 else:
                     return "❌ Please enter a valid number corresponding to an answer choice."
                 
                 correct_index = correct_index if correct_index is not None else 0  # Default to first option
-                if user_answer_index == correct_index:
+                correct = user_answer_index == correct_index
+                self.repetition.record(user_id, term, correct)
+                if correct:
                     return "✅ Correct!"
                 else:
                     return f"❌ Incorrect! The correct answer was: {mcq_questions[correct_index]}"
 
 
-            elif session["format"] == "Fill-in-the-Blank":
-                if user_answer.strip().lower() == term.lower():
+            elif session.format == "Fill-in-the-Blank":
+                correct = user_answer.strip().lower() == term.lower()
+                self.repetition.record(user_id, term, correct)
+                if correct:
                     return "✅ Correct!"
                 return f"❌ Incorrect. The correct answer was: {term}"
 
             else:
+                verdict = await self.grade_locally(session, term, user_answer)
+                if verdict:
+                    self.grading_stats["local"] += 1
+                    self.repetition.record(user_id, term, True)
+                    return verdict
+
+                self.grading_stats["llm"] += 1
                 prompt = f"""
                 You are an AI tutor. The user was asked:
                 'What does {term} mean?'
@@ -275,41 +697,164 @@ Do NOT number them or include any list formatting (e.g., no dashes, no bullets).
                 """
 
             messages = [{"role": "user", "content": prompt}]
-            response = self.mistral.chat.complete(
-                model="mistral-tiny", messages=messages)
-            return response.choices[0].message.content.strip()
+            if on_partial:
+                feedback = await self.stream_complete(messages, on_partial, call_site="grade_answer")
+            else:
+                # Grading depends on the user's answer, so it is never served from the cache
+                feedback = await self.complete(messages, cache=False, call_site="grade_answer")
+            verdict = feedback.lstrip(' "*').lower()
+            if verdict.startswith(("✅", "correct", "❌", "incorrect")):
+                self.repetition.record(user_id, term, verdict.startswith(("✅", "correct")))
+            return feedback
 
         except Exception as e:
             logging.error(f"Error communicating with MistralAI: {str(e)}")
+            if is_rate_limited(e):
+                return "⏳ I'm answering a lot of questions right now. Please send your answer again in a moment."
             return "⚠️ Error evaluating the response. Please try again."
 
-    def process_pdf(self, pdf_path):
+    async def get_reference_definition(self, session, term):
+        """The term's definition from the compiled deck, or a (cached) generated one."""
+        card = self.get_card(session, session.current_term)
+        if card and card.get("definition") and card["term"] == term:
+            return card["definition"]
+        return await self.generate_correct_answer(term)
+
+    async def grade_locally(self, session, term, user_answer):
+        """Grades a Free Response answer by its similarity to the reference definition.
+
+        Only clear matches are graded here. Returns None when the LLM should decide.
+        """
+        reference = await self.get_reference_definition(session, term)
+        if reference == "Correct definition not available.":
+            return None
+
+        score = answer_similarity(user_answer, reference, term)
+        logger.debug(f"Local grading score for '{term}': {score:.2f}")
+        if score >= GRADE_ACCEPT_THRESHOLD:
+            return "✅ Correct!"
+        return None
+
+    def local_grading_rate(self):
+        graded = self.grading_stats["local"] + self.grading_stats["llm"]
+        return self.grading_stats["local"] / graded if graded else 0.0
+
+    async def process_pdf(self, pdf_path, progress=None, document_hash=None):
+        """Extracts the PDF's text in a process pool so the event loop stays responsive.
+
+        With a document_hash, text already extracted from the same file is returned from the cache,
+        and users who confirm the same upload while it is being extracted share that extraction.
+        """
+        if not document_hash:
+            return await self.extract_pdf(pdf_path, progress)
+
+        cached = self.document_cache.get(f"text:{document_hash}")
+        if cached is not None:
+            return cached
+
+        task = self.pdf_extractions.get(document_hash)
+        if task is None:
+            task = asyncio.create_task(self.extract_pdf(pdf_path, progress, f"text:{document_hash}"))
+            self.pdf_extractions[document_hash] = task
+            task.add_done_callback(lambda _: self.pdf_extractions.pop(document_hash, None))
+        # Shielded so one user going away doesn't cancel the extraction for the others
+        return await asyncio.shield(task)
+
+    async def extract_pdf(self, pdf_path, progress=None, cache_key=None):
         if not os.path.exists(pdf_path):
             logger.error(f"❌ PDF file not found at path: {pdf_path}")
             return "❌ Error: PDF file not found."
 
-        extracted_text = ""
-
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for i, page in enumerate(pdf.pages):
-                    page_text = page.extract_text()
-
-                    if page_text:
-                        extracted_text += page_text + "\n"
+            extracted_text = await extract_pdf_text(
+                pdf_path, max_pages=MAX_PDF_PAGES, max_chars=MAX_PDF_CHARS, progress=progress)
 
             if not extracted_text.strip():
                 return "⚠ No readable text found in the PDF."
 
+            if cache_key:
+                self.document_cache.set(cache_key, extracted_text)
             return extracted_text
 
         except Exception as e:
+            logger.error(f"Error processing PDF: {e}")
             return "❌ An error occurred while processing the PDF."
 
-    def extract_study_terms(self, user_id, text):
-        """Uses Mistral AI to extract key study terms and stores them in the session."""
+    async def extract_study_terms(self, user_id, text=None):
+        """Uses Mistral AI to extract key study terms and stores them in the session.
+
+        Terms of an uploaded document are cached per (document hash, number of questions). Without
+        text, the document's extracted text is read back from the document cache.
+        """
+        session = self.sessions.get(user_id) or Session()
+        num_questions = session.num_questions or 10
+        document_hash = session.document_hash
+        deck = self.decks.load(document_key(document_hash)) if document_hash else None
+        cache_key = f"terms:{document_hash}:{num_questions}" if document_hash else None
+        cached = self.document_cache.get(cache_key) if cache_key and not deck else None
+        if deck:
+            # Precompiled decks list their terms most important first
+            terms = [card["term"] for card in deck["cards"]][:num_questions]
+        elif cached is not None:
+            terms = json.loads(cached)
+        else:
+            if text is None and document_hash:
+                text = self.document_cache.get(f"text:{document_hash}")
+            terms = await self.extract_document_terms(text, num_questions) if text else []
+            if not terms:
+                return ["❌ An error occurred while processing the text."]
+            if cache_key:
+                self.document_cache.set(cache_key, json.dumps(terms))
+
+        self.cancel_prefetches(user_id)
+        session.terms = self.repetition.order_terms(user_id, terms)
+        session.current_term = 0
+        session.format = None
+        session.deck = self.precompiled_cards(deck, session.terms) if deck else None
+        session.setup = True
+        self.sessions.save(user_id, session)
+
+        return terms
+
+    def evict_idle_sessions(self):
+        """Drops idle sessions, and the prefetches of any user who no longer has a session."""
+        evicted = self.sessions.evict_idle()
+        for user_id in evicted + [u for u in self.prefetches if u not in self.sessions]:
+            self.cancel_prefetches(user_id)
+        return evicted
+
+    async def extract_document_terms(self, text, num_questions):
+        """Splits the text into token-bounded chunks, extracts candidate terms from them
+        concurrently, then merges and ranks them down to num_questions.
+
+        Chunks grow with the document up to MAX_TERM_CHUNK_TOKENS so it fits in one round of as
+        many calls as the chunk_terms model can take at once. A longer document takes further
+        rounds, up to MAX_TERM_CHUNKS chunks in all; beyond that the chunks are sampled evenly
+        across it and the share left out is logged.
+        """
+        concurrency = self.scheduler.concurrency(self.router.choose("chunk_terms"))
+        tokens = estimate_tokens(text)
+        rounds = max(1, math.ceil(tokens / (concurrency * MAX_TERM_CHUNK_TOKENS)))
+        calls = max(1, min(MAX_TERM_CHUNKS, concurrency * rounds))
+        chunk_tokens = min(MAX_TERM_CHUNK_TOKENS, max(TERM_CHUNK_TOKENS, math.ceil(tokens / calls)))
+        all_chunks = split_into_chunks(text, chunk_tokens)
+        # Breaking on lines can leave a short extra chunk; it just waits for a free slot
+        chunks = spread_sample(all_chunks, MAX_TERM_CHUNKS)
+        if len(chunks) < len(all_chunks):
+            skipped = 1 - sum(estimate_tokens(chunk) for chunk in chunks) / tokens
+            logger.warning(f"Document too long for term extraction: {skipped:.0%} of its text was not read")
+        # Ask every chunk for a share of the terms, with headroom for duplicates across chunks
+        per_chunk = num_questions if len(chunks) <= 1 else min(
+            num_questions, max(3, math.ceil(2 * num_questions / len(chunks))))
+
+        with llm_priority(PRIORITY_SETUP):
+            candidate_lists = await asyncio.gather(
+                *(self.extract_chunk_terms(chunk, per_chunk) for chunk in chunks))
+        return rank_terms(candidate_lists, num_questions)
+
+    async def extract_chunk_terms(self, text, count):
         prompt = (
-            f"Extract exactly {self.sessions[user_id].get('num_questions', 10)} important single-word or short-phrase terms from the following text.\n\n"
+            f"Extract exactly {count} important single-word or short-phrase terms from the following text.\n\n"
             f"{text}\n\n"
             "Requirements:\n"
             "1. Terms should be 1-3 words maximum.\n"
@@ -320,44 +865,21 @@ Do NOT number them or include any list formatting (e.g., no dashes, no bullets).
 
         try:
             messages = [{"role": "system", "content": prompt}]
-            response = self.mistral.chat.complete(
-                model=MISTRAL_MODEL,
-                messages=messages
-            )
-
-            response_text = response.choices[0].message.content.strip()
-            terms = response_text.split("\n") if response_text else []
-
-            if user_id not in self.sessions:
-                self.sessions[user_id] = {}
-
-            self.sessions[user_id].update({
-                "terms": terms,
-                "current_term": 0,
-                "format": None,
-                "setup": True
-            })
-
-            return terms
-
+            response_text = await self.complete(messages, call_site="chunk_terms")
+            return parse_term_lines(response_text)
         except Exception as e:
             logger.error(f"Error calling Mistral AI: {e}")
-            return ["❌ An error occurred while processing the text."]
+            return []
 
-    def generate_terms_from_subject(self, subject):
-        prompt = f"Generate a list of 10 important study terms related to the subject '{subject}'. Each term should be 1-3 words maximum. Avoid full sentences. Focus on key technical terms or concepts. Return the terms as a list, one per line."
+    async def generate_terms_from_subject(self, subject, count=10):
+        prompt = f"Generate a list of {count} important study terms related to the subject '{subject}'. Each term should be 1-3 words maximum. Avoid full sentences. Focus on key technical terms or concepts. Return the terms as a list, one per line."
 
         try:
             messages = [{"role": "user", "content": prompt}]
-            response = self.mistral.chat.complete(
-                model=MISTRAL_MODEL,
-                messages=messages
-            )
-
-            response_text = response.choices[0].message.content.strip()
+            response_text = await self.complete(messages, call_site="subject_terms")
             terms = [term.strip()
                      for term in response_text.split("\n") if term.strip()]
-            terms = terms[:10]  # Limit to 10 terms
+            terms = terms[:count]
             return terms
 
         except Exception as e:
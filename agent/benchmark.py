@@ -0,0 +1,361 @@
+# Offline load test: simulated users run full study sessions through DiscordBot.on_message,
+# against a fake Mistral client and stand-ins for Discord channels and attachments.
+#
+#   python benchmark.py --users 2000 --latency 0.4 --error-rate 0.01
+#
+# The scheduler's limits (MISTRAL_REQUESTS_PER_SECOND, MISTRAL_MAX_CONCURRENCY, ...) and the
+# session store (SESSION_STORE_PATH) are read from the environment as usual.
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+import types
+
+from mistralai import models
+
+DEFINITION_TOPICS = "energy structure transport growth signals balance storage defense heat light".split()
+PDF_WORDS = ("photosynthesis chlorophyll mitochondria ribosome osmosis enzyme glucose membrane nucleus "
+             "cytoplasm diffusion respiration protein lipid catalyst").split()
+FORMAT_REPLIES = ("free response", "multiple choice", "fill in the blank")
+
+
+class FakeMistral:
+    """Stands in for the Mistral client: canned replies after a random delay, with injected errors."""
+
+    def __init__(self, latency=0.3, jitter=0.5, error_rate=0.0, token_latency=0.01, model_latency=None, rng=None):
+        self.latency = latency  # for streamed replies, the time to the first token
+        self.model_latency = model_latency or {}  # model -> latency, for models slower or faster than the rest
+        self.jitter = jitter  # delays vary uniformly by this fraction of latency
+        self.error_rate = error_rate
+        self.token_latency = token_latency  # seconds between streamed words
+        self.rng = rng or random.Random()
+        self.calls = 0
+        self.errors = 0
+        self.chat = types.SimpleNamespace(complete_async=self.complete_async, stream_async=self.stream_async)
+
+    async def respond(self, model, messages):
+        self.calls += 1
+        latency = self.model_latency.get(model, self.latency)
+        await asyncio.sleep(latency * self.rng.uniform(1 - self.jitter, 1 + self.jitter))
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            status = self.rng.choice([429, 500, 503])
+            raise models.SDKError(f"Simulated API error {status}", status_code=status)
+
+        content = self.reply(messages[-1]["content"])
+        usage = types.SimpleNamespace(
+            prompt_tokens=sum(len(m["content"]) for m in messages) // 4, completion_tokens=len(content) // 4)
+        return content, usage
+
+    async def complete_async(self, model, messages, **options):
+        content, usage = await self.respond(model, messages)
+        await asyncio.sleep(self.token_latency * len(content.split()))  # the same generation time as streaming
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))], usage=usage)
+
+    async def stream_async(self, model, messages, **options):
+        content, usage = await self.respond(model, messages)
+
+        async def events():
+            words = re.findall(r"\S+\s*", content)
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(self.token_latency)
+                delta = types.SimpleNamespace(content=word)
+                yield types.SimpleNamespace(data=types.SimpleNamespace(
+                    choices=[types.SimpleNamespace(delta=delta)], usage=usage if i == len(words) - 1 else None))
+
+        return events()
+
+    def reply(self, prompt):
+        """A plausible reply for each of StudyAgent's prompts, recognized by its wording."""
+        if "study cards for each of these terms" in prompt:
+            terms = json.loads(re.search(r"these terms: (\[.*?\])", prompt).group(1))
+            return json.dumps({"cards": [{
+                "term": term,
+                "definition": f"A key idea in this subject, to do with "
+                              f"{DEFINITION_TOPICS[sum(map(ord, term)) % len(DEFINITION_TOPICS)]}.",
+                "distractors": [f"{term} is a kind of rock.", f"{term} is a unit of time.", f"{term} is a color."],
+                "sentence": f"The teacher explained how **___** works ({len(term)} letters).",
+            } for term in terms]})
+        if "study terms and subject" in prompt:
+            message = prompt.split("user message:")[1].split("Respond in JSON")[0]
+            terms = [t.strip() for t in re.split(r"[,\n]", message) if t.strip()]
+            return json.dumps({"terms": terms or ["term"], "subject": "biology"})
+        if "study format" in prompt:
+            message = prompt.split("user message:")[1].split("The format")[0].lower()
+            study_format = ("Multiple Choice" if "multiple" in message
+                            else "Fill-in-the-Blank" if "blank" in message else "Free Response")
+            return json.dumps({"format": study_format})
+        if "important single-word or short-phrase terms" in prompt:
+            count = int(re.search(r"Extract exactly (\d+)", prompt).group(1))
+            return "\n".join(self.rng.sample(PDF_WORDS, min(count, len(PDF_WORDS))))
+        if "important study terms" in prompt:
+            return "\n".join(PDF_WORDS[:10])
+        if "incorrect definitions" in prompt:
+            return "A kind of rock.\nA unit of time.\nA color."
+        if "fill-in-the-blank sentence" in prompt:
+            return "The teacher explained how **___** works."
+        if "succinct and short definition" in prompt:
+            return "A key idea in this subject."
+        if "Evaluate if the answer is correct" in prompt:
+            if self.rng.random() < 0.5:
+                return "✅ Correct! That captures the main idea."
+            return "❌ Incorrect. It is a key idea in this subject, which your answer leaves out."
+        return "OK"
+
+
+class SimulatedChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.replies = []
+        self.first_reply_at = None
+        self.edits = 0
+
+    async def send(self, content=None, **kwargs):
+        self.replies.append(content)
+        if self.first_reply_at is None:
+            self.first_reply_at = time.perf_counter()
+        return SimulatedReply(self, content)
+
+
+class SimulatedReply:
+    def __init__(self, channel, content):
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):
+        self.content = content
+        self.channel.edits += 1
+
+
+class SimulatedUser:
+    def __init__(self, user_id, bot=False):
+        self.id = user_id
+        self.bot = bot
+
+    def mentioned_in(self, message):
+        return any(user.id == self.id for user in message.mentions)
+
+    def __eq__(self, other):
+        return isinstance(other, SimulatedUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return f"user{self.id}"
+
+
+class SimulatedMessage:
+    def __init__(self, author, channel, content="", attachments=()):
+        self.author = author
+        self.channel = channel
+        self.content = content
+        self.attachments = list(attachments)
+        self.mentions = []
+        self.guild = None
+
+
+def build_pdf(pages):
+    """A minimal PDF with one line of text per page, enough for pdfplumber to extract."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))}] /Count {len(pages)} >>",
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+
+async def serve_documents(documents):
+    """Serves {name: bytes} over local HTTP, standing in for Discord's attachment CDN."""
+
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            name = request_line.split()[1].decode().lstrip("/") if request_line else ""
+            body = documents.get(name)
+            status = "200 OK" if body is not None else "404 Not Found"
+            body = body or b""
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/pdf\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+class LoadTest:
+    def __init__(self, bot, args, attachment_url):
+        self.bot = bot
+        self.args = args
+        self.attachment_url = attachment_url
+        self.rng = random.Random(args.seed)
+        self.turns = []  # (phase, seconds, seconds until the first reply)
+        self.completed = 0
+        self.sends = 0
+        self.edits = 0
+
+    async def turn(self, message):
+        phase = self.bot.turn_phase(message, self.bot.study_agent.sessions.get(message.author.id))
+        message.channel.first_reply_at = None
+        started = time.perf_counter()
+        await self.bot.on_message(message)
+        finished = time.perf_counter()
+        self.turns.append((phase, finished - started, (message.channel.first_reply_at or finished) - started))
+        if self.args.think:
+            await asyncio.sleep(self.rng.uniform(0, self.args.think))
+
+    async def run_user(self, number):
+        await asyncio.sleep(self.rng.uniform(0, self.args.ramp))
+        user = SimulatedUser(10_000 + number)
+        channel = SimulatedChannel(20_000 + number)
+        say = lambda content="", attachments=(): self.turn(SimulatedMessage(user, channel, content, attachments))
+
+        if self.rng.random() < self.args.pdf_share:
+            document = f"doc{self.rng.randrange(self.args.documents)}.pdf"
+            attachment = types.SimpleNamespace(
+                filename=document, url=f"{self.attachment_url}/{document}", size=self.args.pdf_bytes)
+            await say(attachments=[attachment])
+            await say("yes")
+            await say(str(self.args.terms))
+        else:
+            await say(", ".join(self.rng.sample(PDF_WORDS, self.args.terms)))
+
+        await say(FORMAT_REPLIES[number % len(FORMAT_REPLIES)])
+        session = self.bot.study_agent.sessions.get(user.id)
+        for _ in range(session.question_count if session else 0):
+            session = self.bot.study_agent.sessions.get(user.id)
+            if session is None:
+                break
+            if session.format == "Multiple Choice":
+                answer = str(self.rng.randint(1, 4))
+            elif session.format == "Fill-in-the-Blank":
+                answer = session.terms[session.current_term] if self.rng.random() < 0.7 else "no idea"
+            else:
+                answer = self.rng.choice(["a key idea in this subject", "something about cells", "no idea"])
+            await say(answer)
+
+        if any(reply and "Study session complete" in reply for reply in channel.replies[-2:]):
+            self.completed += 1
+        self.sends += len(channel.replies)
+        self.edits += channel.edits
+
+    def report(self, elapsed, mistral):
+        def percentiles(samples):
+            if len(samples) < 2:
+                return samples * 3 if samples else [0.0] * 3
+            cuts = statistics.quantiles(samples, n=100, method="inclusive")
+            return [cuts[49], cuts[94], cuts[98]]
+
+        print(f"{self.args.users} users, {len(self.turns)} turns in {elapsed:.1f}s: "
+              f"{len(self.turns) / elapsed:.1f} turns/s, {self.completed} sessions completed")
+        print(f"Mistral calls: {mistral.calls} ({mistral.errors} injected errors), "
+              f"LLM cache hit rate {self.bot.study_agent.llm_cache.hit_rate():.1%}, "
+              f"local grading rate {self.bot.study_agent.local_grading_rate():.1%}")
+        print(f"Discord requests: {self.sends / len(self.turns):.2f} sends and "
+              f"{self.edits / len(self.turns):.2f} edits per turn")
+        print(f"{'phase':<16}{'turns':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'1st reply p50':>16}{'p95':>10}")
+        phases = sorted({phase for phase, _, _ in self.turns})
+        for phase in ["all"] + phases:
+            turns = [turn for turn in self.turns if phase in ("all", turn[0])]
+            p50, p95, p99 = percentiles([seconds for _, seconds, _ in turns])
+            first50, first95, _ = percentiles([first for _, _, first in turns])
+            print(f"{phase:<16}{len(turns):>8}{p50 * 1000:>8.0f}ms{p95 * 1000:>8.0f}ms{p99 * 1000:>8.0f}ms"
+                  f"{first50 * 1000:>14.0f}ms{first95 * 1000:>8.0f}ms")
+
+
+async def run(args, workdir):
+    import bot as bot_module
+    import http_client
+    from bot import DiscordBot
+    from pdf_extract import shutdown_executor
+
+    bot = DiscordBot()
+    bot._connection.user = SimulatedUser(1, bot=True)
+    bot_module.TEMP_DIR = os.path.join(workdir, "temp")
+
+    model_latency = {model: float(seconds) for model, seconds in (item.split("=") for item in args.model_latency)}
+    mistral = FakeMistral(args.latency, args.jitter, args.error_rate, args.token_latency, model_latency,
+                          random.Random(args.seed))
+    bot.study_agent.mistral = mistral
+
+    documents = {
+        f"doc{i}.pdf": build_pdf([" ".join(random.Random(i * 1000 + page).sample(PDF_WORDS, 8))
+                                  for page in range(args.pdf_pages)])
+        for i in range(args.documents)
+    }
+    server = await serve_documents(documents)
+    host, port = server.sockets[0].getsockname()[:2]
+    load = LoadTest(bot, args, f"http://{host}:{port}")
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(load.run_user(number) for number in range(args.users)))
+    finally:
+        elapsed = time.perf_counter() - started
+        server.close()
+        await http_client.aclose()
+        shutdown_executor()
+    load.report(elapsed, mistral)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the bot offline with simulated users and a fake Mistral.")
+    parser.add_argument("--users", type=int, default=500, help="concurrent virtual users, one full session each")
+    parser.add_argument("--terms", type=int, default=5, help="terms per session")
+    parser.add_argument("--pdf-share", type=float, default=0.3, help="fraction of users who start from a PDF")
+    parser.add_argument("--documents", type=int, default=5, help="distinct PDFs shared among those users")
+    parser.add_argument("--pdf-pages", type=int, default=20)
+    parser.add_argument("--pdf-bytes", type=int, default=100_000, help="attachment size reported to the bot")
+    parser.add_argument("--latency", type=float, default=0.3, help="mean fake Mistral latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency spread as a fraction of the mean")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="mean latency of one model, e.g. mistral-large-latest=6 (repeatable)")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds between streamed words")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of Mistral calls that fail")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which users arrive")
+    parser.add_argument("--think", type=float, default=0.0, help="max seconds a user pauses between messages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="use the configured LLM and document caches and review log instead of empty ones")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory(prefix="quizai-bench-") as workdir:
+        if not args.warm_cache:
+            # Set before agent.py is imported, since it reads these at import time
+            os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm.sqlite3")
+            os.environ["DOCUMENT_CACHE_PATH"] = os.path.join(workdir, "documents.sqlite3")
+            os.environ["REVIEW_LOG_PATH"] = os.path.join(workdir, "reviews.log")
+        asyncio.run(run(args, workdir))
+
+
+if __name__ == "__main__":
+    main()
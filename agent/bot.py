@@ -3,36 +3,180 @@
 # It will then call the on_message function.
 
 from agent import StudyAgent # load our agent.py class
-
+from sessions import SESSION_TTL, Session
+from metrics import metrics
+from outbox import Outbox
+from downloads import DownloadError, download_pdf
+from pdf_extract import shutdown_executor
+import http_client
+
+import asyncio
+import contextlib
 import logging # other imports
 import platform
 import os
-import aiohttp
+import time
 
 from dotenv import load_dotenv # load environment variables
 load_dotenv()
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 intents = discord.Intents.default() # enable access to all message content
 intents.message_content = True
 
 logger = logging.getLogger("discord") # log discord messages
-logger.setLevel(logging.INFO)
+logger.setLevel(os.getenv("DISCORD_LOG_LEVEL", "INFO").upper())
 
 PREFIX = "!"
 CUSTOM_STATUS = "you learn | @QuizAI"
+PROGRESS_INTERVAL = 2.0  # seconds between PDF progress edits
+TEMP_DIR = "./temp"
+TEMP_FILE_MAX_AGE = SESSION_TTL  # seconds before an unclaimed upload is deleted; its pending session is gone by then
+MAX_PDF_BYTES = int(os.getenv("MAX_PDF_BYTES", str(50 * 1024 * 1024)))
+SESSION_EVICTION_INTERVAL = 300  # seconds between sweeps for idle sessions
+STREAM_FEEDBACK = os.getenv("STREAM_FEEDBACK", "1") != "0"  # stream LLM feedback into an edited message
+STREAM_EDIT_INTERVAL = 1.0  # seconds between edits of a streamed message, to stay under Discord's rate limit
+METRICS_PATH = os.getenv("METRICS_PATH")  # Prometheus text file, rewritten every METRICS_INTERVAL
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # serves Prometheus text over HTTP when set
+METRICS_INTERVAL = 15  # seconds
+HELP_MESSAGE = (
+    ">>> **QuizAI Help Guide**\n"
+    "I can help you study using flashcards in various formats!\n\n"
+    "Commands:\n"
+    "`@QuizAI` - Show this help message.\n\n"
+    "To start a study session, simply send any message with the terms you want to study (comma separated).\n"
+    "You can also upload a PDF file, and I will extract study terms from it.\n"
+    "Send `review` to go over the terms you're due to review.\n\n"
+    "After starting a session, you can choose the study format:\n"
+    "- Free Response\n"
+    "- Multiple Choice\n"
+    "- Fill-in-the-Blank\n"
+)
+
+def cleanup_temp_files(max_age=TEMP_FILE_MAX_AGE):
+    """Removes uploads left behind by canceled, abandoned or evicted pending extractions."""
+    if not os.path.isdir(TEMP_DIR):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(TEMP_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+
+class StreamedReply:
+    """A reply that is sent as soon as its first text is known, then edited as more arrives.
+
+    update() never waits on Discord: edits are coalesced so at most one is in flight, and at most
+    one goes out per STREAM_EDIT_INTERVAL. finish() edits in the final text, or when nothing was
+    streamed, adds it to the turn to go out with the rest of the replies.
+    """
+
+    def __init__(self, turn, interval=STREAM_EDIT_INTERVAL):
+        self.turn = turn
+        self.interval = interval
+        self.message = None
+        self.shown = None  # text of the last send or edit
+        self.latest = None
+        self.last_update = 0.0
+        self.in_flight = None
+
+    def update(self, text):
+        self.latest = text
+        if not text.strip() or (self.in_flight and not self.in_flight.done()):
+            return
+        if self.message is None or time.monotonic() - self.last_update >= self.interval:
+            self.in_flight = asyncio.create_task(self.show(text))
+
+    async def show(self, text):
+        self.last_update = time.monotonic()
+        try:
+            if self.message is None:
+                self.message = await self.turn.send(text)
+            elif text != self.shown:
+                await self.message.edit(content=text)
+            self.shown = text
+        except discord.HTTPException as e:
+            logger.warning(f"Could not update streamed reply: {e}")
+
+    async def finish(self, text):
+        if self.in_flight:
+            await self.in_flight
+        if self.message is None:
+            self.turn.add(text)
+        elif text != self.shown:
+            await self.show(text)
+
+
+class AdminCommands(commands.Cog):
+    """Commands only the bot owner or a server administrator may use."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.command(name="stats")
+    @commands.check_any(commands.is_owner(), commands.has_permissions(administrator=True))
+    async def stats(self, ctx):
+        """Shows LLM and turn latency percentiles, token counts and cache hit rates."""
+        await ctx.send(metrics.summary()[:2000])  # Discord's message length limit
+
+    async def cog_command_error(self, ctx, error):
+        if isinstance(error, commands.CheckFailure):
+            await ctx.send("❌ Only server administrators can use this command.")
+        else:
+            raise error
 
-# Globals
-pending_extractions = {}
-bot = commands.Bot(command_prefix='!', intents=intents)
-ctx = None
 
-class DiscordBot(commands.Bot):
-    def __init__(self):
-        super().__init__(command_prefix=commands.when_mentioned_or(PREFIX), intents=intents)
+class DiscordBot(commands.AutoShardedBot):
+    def __init__(self, shard_ids=None, shard_count=None):
+        # With no shard_ids this process connects every shard Discord recommends;
+        # launcher.py passes each worker process its own slice.
+        super().__init__(
+            command_prefix=commands.when_mentioned_or(PREFIX), intents=intents,
+            shard_ids=shard_ids, shard_count=shard_count)
         self.logger = logger
         self.study_agent = StudyAgent()
+        self.outbox = Outbox()
+        self.user_locks = {}  # user_id -> [asyncio.Lock, messages holding or waiting for it]
+        self.metrics_server = None
+        # Phase of a message (see turn_phase) -> its handler
+        self.handlers = {
+            "help": self.handle_mention,
+            "upload": self.handle_upload,
+            "pdf_confirm": self.handle_pdf_confirmation,
+            "awaiting_count": self.handle_question_count,
+            "new": self.handle_new_session,
+            "setup": self.handle_format_selection,
+            "answering": self.handle_answer,
+        }
+
+    async def setup_hook(self):
+        await self.add_cog(AdminCommands(self))
+        self.evict_idle_sessions.start()
+        if METRICS_PATH:
+            self.export_metrics.start()
+        if METRICS_PORT:
+            self.metrics_server = await metrics.serve(METRICS_PORT)
+
+    @tasks.loop(seconds=SESSION_EVICTION_INTERVAL)
+    async def evict_idle_sessions(self):
+        evicted = self.study_agent.evict_idle_sessions()
+        if evicted:
+            self.logger.info(f"Evicted {len(evicted)} idle study sessions")
+        await asyncio.to_thread(cleanup_temp_files)
+
+    @tasks.loop(seconds=METRICS_INTERVAL)
+    async def export_metrics(self):
+        await asyncio.to_thread(metrics.write_prometheus, METRICS_PATH)
+
+    async def close(self):
+        self.evict_idle_sessions.cancel()
+        self.export_metrics.cancel()
+        if self.metrics_server:
+            self.metrics_server.close()
+        await http_client.aclose()
+        shutdown_executor()
+        await super().close()
 
     async def on_ready(self):
         self.logger.info("-------------------")
@@ -48,184 +192,231 @@ class DiscordBot(commands.Bot):
         )
 
     async def on_message(self, message: discord.Message):
-        global ctx
-        ctx = await bot.get_context(message)
-        await self.process_commands(message)
-        self.logger.info(f"Message from {message.author}: {message.content}")
-
-        # Ignore messages from self, bots, or commands
-        if message.author == self.user or message.author.bot:
+        # Cheap checks first, before any session lookup or context building
+        if message.author.bot:
             return
-
-        # Handle @QuizAI mention
-        if self.user.mentioned_in(message):
-            await self.show_help(self, ctx)
+        if message.content.startswith(PREFIX) and self.is_command(message):
+            await self.process_commands(message)
             return
 
-        user_id = message.author.id
-        content = message.content.strip()
-
-        # **Handle PDF Uploads**
+        self.logger.debug(f"Message from {message.author}: {message.content}")
+        async with self.user_lock(message.author.id):
+            session = self.study_agent.sessions.get(message.author.id)
+            phase = self.turn_phase(message, session)
+            started = time.perf_counter()
+            try:
+                # Replies are merged into as few messages as possible and sent when the turn ends
+                async with self.outbox.turn(message.channel) as reply:
+                    await self.handlers[phase](message, session, reply)
+            finally:
+                metrics.observe("turn_seconds", time.perf_counter() - started, phase=phase)
+
+    @contextlib.asynccontextmanager
+    async def user_lock(self, user_id):
+        """Handles one message per user at a time, in the order they arrived.
+
+        Every handler reads the session, awaits the LLM and saves the session back, so two
+        messages from one user running side by side would grade against the same term and
+        overwrite each other's saves. Locks are dropped once no message holds or awaits them.
+        """
+        entry = self.user_locks.get(user_id)
+        if entry is None:
+            entry = self.user_locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.user_locks[user_id]
+
+    def turn_phase(self, message, session):
+        """Picks the handler for a message from what it carries and the user's session phase."""
+        if self.user.mentioned_in(message):
+            return "help"
         if message.attachments:
-            for attachment in message.attachments:
-                if attachment.filename.lower().endswith(".pdf"):
-                    await ctx.send(
-                        f"📄 I detected a PDF file: `{attachment.filename}`. Would you like me to extract study terms from it? Reply with `yes` or `no`."
-                    )
+            return "upload"
+        if session and session.pending_pdf and message.content.strip().lower() in ["yes", "y", "no", "n"]:
+            return "pdf_confirm"
+        return session.phase if session else "new"
 
-                    file_path = f"./temp/{attachment.filename}"
-                    os.makedirs("./temp", exist_ok=True)
+    def is_command(self, message):
+        parts = message.content[len(PREFIX):].split(maxsplit=1) if message.content.startswith(PREFIX) else []
+        return bool(parts) and self.get_command(parts[0]) is not None
 
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            async with session.get(attachment.url) as resp:
-                                if resp.status == 200:
-                                    with open(file_path, "wb") as f:
-                                        f.write(await resp.read())
+    async def handle_mention(self, message, session, reply):
+        reply.add(HELP_MESSAGE)
 
-                        if not os.path.exists(file_path):
-                            logger.error(f"❌ File was not saved correctly: {file_path}")
-                            await ctx.send("❌ Error saving file. Please try again.")
-                            return
+    async def handle_upload(self, message, session, reply):
+        user_id = message.author.id
+        attachment = message.attachments[0]
+        if not attachment.filename.lower().endswith(".pdf"):
+            reply.add("❌ Sorry, I only support PDF files for study term extraction.")
+            return
 
-                        logger.info(f"✅ PDF successfully saved at: {file_path}")
+        if attachment.size > MAX_PDF_BYTES:
+            reply.add(f"❌ That file is too large. The limit is {MAX_PDF_BYTES // (1024 * 1024)} MB.")
+            return
 
-                    except Exception as e:
-                        logger.error(f"❌ Error downloading file: {e}")
-                        await ctx.send("❌ Error downloading file. Please try again.")
-                        return
+        await reply.send(
+            f"📄 I detected a PDF file: `{attachment.filename}`. Would you like me to extract study terms from it? Reply with `yes` or `no`."
+        )
 
-                    pending_extractions[user_id] = file_path
-                    return 
-                else:
-                    await ctx.send("❌ Sorry, I only support PDF files for study term extraction.")
-                    return
+        try:
+            # Uploads are stored by content hash, so identical PDFs share one file and one set of cached results
+            document_hash, file_path = await download_pdf(attachment.url, TEMP_DIR, MAX_PDF_BYTES)
+            logger.info(f"✅ PDF successfully saved at: {file_path}")
 
+        except DownloadError as e:
+            reply.add(str(e))
+            return
 
-        # **Handle PDF Processing Confirmation**
-        if user_id in pending_extractions and content.lower() in ["yes", "y"]:
-            pdf_path = pending_extractions.pop(user_id)
-            await ctx.send("🔍 Extracting study terms from your document... Please wait.")
-            logger.info(f"🔍 Calling process_pdf() with path: {pdf_path}")
-            extracted_text = self.study_agent.process_pdf(pdf_path)
+        except Exception as e:
+            logger.error(f"❌ Error downloading file: {e}")
+            reply.add("❌ Error downloading file. Please try again.")
+            return
 
-            if extracted_text.startswith("⚠") or extracted_text.startswith("❌"):
-                await ctx.send(extracted_text)
-                return
+        # Re-read the session: the download may have taken a while
+        session = self.study_agent.sessions.get(user_id) or Session()
+        session.pending_pdf = [document_hash, file_path]
+        self.study_agent.sessions.save(user_id, session)
 
-            self.study_agent.sessions[user_id] = {
-                "extracted_text": extracted_text,
-                "awaiting_question_count": True
-            }
-            
-            await ctx.send("✅ Extraction complete! How many questions would you like to study? (Enter a number)")
-            return
+    async def handle_pdf_confirmation(self, message, session, reply):
+        user_id = message.author.id
+        document_hash, pdf_path = session.pending_pdf
+        session.pending_pdf = None
+        self.study_agent.sessions.save(user_id, session)
 
-        elif user_id in pending_extractions and content.lower() in ["no", "n"]:
-            pending_extractions.pop(user_id)
-            await ctx.send("❌ PDF processing canceled.")
+        if message.content.strip().lower() in ["no", "n"]:
+            # The file may be shared with another user's pending upload; the periodic temp sweep removes it
+            reply.add("❌ PDF processing canceled.")
             return
 
-        if "awaiting_question_count" in self.study_agent.sessions.get(user_id, {}):
-            try:
-                num_questions = int(content)
-                if num_questions <= 0:
-                    await ctx.send("⚠ Please enter a positive number.")
-                    return
-                    
-                session = self.study_agent.sessions[user_id]
-                session["num_questions"] = num_questions
-                extracted_text = session.pop("extracted_text")
-                del session["awaiting_question_count"]
-                
-                terms = self.study_agent.extract_study_terms(user_id, extracted_text)
-                response = self.study_agent.start_session(user_id, "") # Reuse existing flow
-                await ctx.send(response)
-                return
-            except ValueError:
-                await ctx.send("⚠ Please enter a valid number.")
-                return
+        status = await reply.send("🔍 Extracting study terms from your document... Please wait.")
+        logger.info(f"🔍 Calling process_pdf() with path: {pdf_path}")
+        extracted_text = await self.study_agent.process_pdf(
+            pdf_path, progress=self.progress_reporter(status), document_hash=document_hash)
 
-        # **New Study Session Handling**
-        if user_id not in self.study_agent.sessions:
-            self.logger.info(f"Starting study session for user {user_id}")
-            response = self.study_agent.start_session(user_id, content)
-            await ctx.send(response)
+        if extracted_text.startswith("⚠") or extracted_text.startswith("❌"):
+            reply.add(extracted_text)
             return
 
-        session = self.study_agent.sessions[user_id]
-
-        # **Handle Study Format Selection**
-        if session.get("setup"):
-            self.logger.info(f"Setting mode for user {user_id}")
-            response = self.study_agent.set_study_format(user_id, content)
-            await ctx.send(response)
-
-            if "format" in session:
-                cur_term = self.study_agent.get_current_term(user_id)
-                if cur_term:
-                    if session["format"] == "Multiple Choice":
-                        mcq_data = self.study_agent.generate_multiple_choice_question(cur_term)
-                        session["mcq_options"] = mcq_data["options"]
-                        session["correct_answer"] = mcq_data["correct_answer"]
-                        formatted_options = "\n".join(
-                            [f"{i + 1}. {option}" for i, option in enumerate(session["mcq_options"])]
-                        )
-
-                        await ctx.send(f"**First question:**\n{mcq_data['question']}")
-                        await ctx.send(f"**Options:**\n{formatted_options}")
-
-                    elif session["format"] == "Fill-in-the-Blank":
-                        question = self.study_agent.generate_fill_in_the_blank_question(cur_term)
-                        await ctx.send(f"\nFirst question:\n{question}")
-                    else:
-                        await ctx.send(f"\nFirst question:\n")
-                        await ctx.send(f">>> What does **'{cur_term}'** mean?")
+        # The text is cached by document hash now, so the upload itself is no longer needed.
+        # Other users waiting on the same document will also be served from that cache.
+        try:
+            os.remove(pdf_path)
+        except FileNotFoundError:
+            pass
+
+        self.study_agent.cancel_prefetches(user_id)
+        self.study_agent.sessions.save(
+            user_id, Session(document_hash=document_hash, awaiting_question_count=True))
+
+        reply.add("✅ Extraction complete! How many questions would you like to study? (Enter a number)")
+
+    async def handle_question_count(self, message, session, reply):
+        user_id = message.author.id
+        try:
+            num_questions = int(message.content.strip())
+        except ValueError:
+            reply.add("⚠ Please enter a valid number.")
+            return
+        if num_questions <= 0:
+            reply.add("⚠ Please enter a positive number.")
             return
 
-        # **Handle Answer Checking and Next Question**
+        session.num_questions = num_questions
+        session.awaiting_question_count = False
+        self.study_agent.sessions.save(user_id, session)
+
+        await self.study_agent.extract_study_terms(user_id)
+        response = await self.study_agent.start_session(user_id, "") # Reuse existing flow
+        reply.add(response)
+
+    async def handle_new_session(self, message, session, reply):
+        user_id = message.author.id
+        self.logger.info(f"Starting study session for user {user_id}")
+        response = await self.study_agent.start_session(user_id, message.content.strip())
+        reply.add(response)
+
+    async def handle_format_selection(self, message, session, reply):
+        user_id = message.author.id
+        self.logger.info(f"Setting mode for user {user_id}")
+        response = await self.study_agent.set_study_format(user_id, message.content.strip())
+        await reply.send(response)  # before building the first question
+
+        session = self.study_agent.sessions.get(user_id)
+        if session and session.format:
+            # The rest of the deck compiles while the user answers the first question
+            self.study_agent.start_deck_compile(user_id)
+            cur_term = self.study_agent.get_current_term(user_id)
+            if cur_term:
+                question = await self.study_agent.get_question(user_id)
+                if session.format == "Multiple Choice":
+                    formatted_options = "\n".join(
+                        [f"{i + 1}. {option}" for i, option in enumerate(question["options"])]
+                    )
+
+                    reply.add(f"**First question:**\n{question['question']}")
+                    reply.add(f"**Options:**\n{formatted_options}")
+
+                elif session.format == "Fill-in-the-Blank":
+                    reply.add(f"\nFirst question:\n{question}")
+                else:
+                    reply.add(f"\nFirst question:\n")
+                    reply.add(f">>> What does **'{cur_term}'** mean?")
+
+    async def handle_answer(self, message, session, reply):
+        user_id = message.author.id
         term = self.study_agent.get_current_term(user_id)
-        mcq_options = session.get("mcq_options") if session["format"] == "Multiple Choice" else None
-        correct_index = session.get("correct_answer") if session["format"] == "Multiple Choice" else None
-        response = self.study_agent.check_answer(user_id, term, content, mcq_options, correct_index)
-        await ctx.send(response)
+        mcq_options = session.mcq_options if session.format == "Multiple Choice" else None
+        correct_index = session.correct_answer if session.format == "Multiple Choice" else None
+        feedback = StreamedReply(reply)
+        response = await self.study_agent.check_answer(
+            user_id, term, message.content.strip(), mcq_options, correct_index,
+            on_partial=feedback.update if STREAM_FEEDBACK else None)
+        await feedback.finish(response)
 
         next_term = self.study_agent.next_term(user_id)
         if next_term:
-            if session["format"] == "Multiple Choice":
-                mcq_data = self.study_agent.generate_multiple_choice_question(next_term)
-                session["mcq_options"] = mcq_data["options"]
-                session["correct_answer"] = mcq_data["correct_answer"]
+            question = await self.study_agent.get_question(user_id)
+            if session.format == "Multiple Choice":
                 formatted_options = "\n".join(
-                    [f"{i + 1}. {option}" for i, option in enumerate(session["mcq_options"])]
+                    [f"{i + 1}. {option}" for i, option in enumerate(question["options"])]
                 )
 
-                await ctx.send(f">>> **Next question:**\n{mcq_data['question']}")
-                await ctx.send(f">>> **Options:**\n{formatted_options}")
-            elif session["format"] == "Fill-in-the-Blank":
-                question = self.study_agent.generate_fill_in_the_blank_question(next_term)
-                await ctx.send(f">>> **Next question:**\n{question}")
+                reply.add(f">>> **Next question:**\n{question['question']}")
+                reply.add(f">>> **Options:**\n{formatted_options}")
+            elif session.format == "Fill-in-the-Blank":
+                reply.add(f">>> **Next question:**\n{question}")
             else:
-                await ctx.send(f"\nNext question:\n")
-                await ctx.send(f">>> What does **'{next_term}'** mean?")
+                reply.add(f"\nNext question:\n")
+                reply.add(f">>> What does **'{next_term}'** mean?")
         else:
-            await ctx.send("\n🎉 Study session complete! Great job!")
+            reply.add("\n🎉 Study session complete! Great job!")
+
+    def progress_reporter(self, status_message):
+        """Returns a progress callback that edits status_message, at most once per PROGRESS_INTERVAL."""
+        last_update = time.monotonic()
+
+        async def report(pages_done, total_pages):
+            nonlocal last_update
+            now = time.monotonic()
+            if now - last_update < PROGRESS_INTERVAL or pages_done == total_pages:
+                return
+            last_update = now
+            try:
+                await status_message.edit(
+                    content=f"🔍 Extracting study terms from your document... ({pages_done}/{total_pages} pages)")
+            except discord.HTTPException as e:
+                logger.warning(f"Could not update extraction progress: {e}")
+
+        return report
 
     @commands.command(name="help")
     async def show_help(self, ctx):
-        help_message = (
-            ">>> **QuizAI Help Guide**\n"
-            "I can help you study using flashcards in various formats!\n\n"
-            "Commands:\n"
-            "`@QuizAI` - Show this help message.\n\n"
-            "To start a study session, simply send any message with the terms you want to study (comma separated).\n"
-            "You can also upload a PDF file, and I will extract study terms from it.\n\n"
-            "After starting a session, you can choose the study format:\n"
-            "- Free Response\n"
-            "- Multiple Choice\n"
-            "- Fill-in-the-Blank\n"
-        )
-        await ctx.send(help_message)
+        await ctx.send(HELP_MESSAGE)
 
 if __name__ == "__main__":
     DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+
+class DiskCache:
+    """A key/value cache stored in SQLite, with TTL expiry and least-recently-used eviction."""
+
+    EVICT_EVERY = 100  # writes between eviction sweeps
+
+    def __init__(self, path, max_entries=50_000, ttl=7 * 24 * 3600):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def get(self, key):
+        now = time.time()
+        row = self.conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            self.misses += 1
+            return None
+
+        self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, now, now),
+        )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def delete(self, key):
+        self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones above max_entries."""
+        self.conn.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,))
+        self.conn.execute(
+            "DELETE FROM cache WHERE key IN "
+            "(SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def close(self):
+        self.conn.close()
+
+
+def normalize_prompt(text):
+    """Collapses whitespace so prompts that differ only in indentation share an entry."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def llm_cache_key(model, messages, **options):
+    """Content-addressed key for a chat completion: the model, the normalized messages and any request options."""
+    payload = json.dumps(
+        [model, [[m["role"], normalize_prompt(m["content"])] for m in messages], options],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
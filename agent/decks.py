@@ -0,0 +1,69 @@
+import gzip
+import json
+import os
+import re
+import time
+
+DECK_DIR = os.getenv("DECK_DIR", "./decks")  # precompiled decks, written by precompile.py
+DECK_FORMAT_VERSION = 1
+
+
+def subject_key(subject):
+    """The deck name for a subject, e.g. "Cell Biology!" -> "subject-cell-biology"."""
+    slug = re.sub(r"[^a-z0-9]+", "-", subject.lower()).strip("-")
+    return f"subject-{slug}" if slug else None
+
+
+def document_key(document_hash):
+    return f"document-{document_hash}"
+
+
+class DeckStore:
+    """Precompiled decks, one gzipped JSON file per subject or document.
+
+    A deck is {"version", "subject", "created", "cards"}, where every card has its term,
+    definition, three distractors and a fill-in-the-blank sentence, so it serves any study
+    format. Decks are kept in memory once read, and re-read when their file changes.
+    """
+
+    def __init__(self, directory=DECK_DIR):
+        self.directory = directory
+        self.loaded = {}  # key -> (file mtime, deck)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.deck.json.gz")
+
+    def load(self, key):
+        """The deck stored under key, or None if there is none in the current format."""
+        if not key or not self.directory:
+            return None
+        path = self.path(key)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self.loaded.pop(key, None)
+            return None
+        loaded = self.loaded.get(key)
+        if loaded and loaded[0] == mtime:
+            return loaded[1]
+
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                deck = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(deck, dict) or deck.get("version") != DECK_FORMAT_VERSION or not deck.get("cards"):
+            return None
+        self.loaded[key] = (mtime, deck)
+        return deck
+
+    def save(self, key, subject, cards):
+        """Writes a deck, replacing any older one atomically. Returns its path."""
+        os.makedirs(self.directory, exist_ok=True)
+        deck = {"version": DECK_FORMAT_VERSION, "subject": subject, "created": time.time(), "cards": cards}
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            json.dump(deck, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, path)
+        return path
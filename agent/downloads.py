@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+
+import http_client
+
+PDF_MAGIC = b"%PDF-"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024  # bytes buffered in memory before the download spills to disk
+
+
+class DownloadError(Exception):
+    """Raised with a user-facing message when an attachment cannot be accepted."""
+
+
+async def download_pdf(url, dest_dir, max_bytes):
+    """Streams a PDF into dest_dir/<sha256>.pdf and returns (document_hash, path).
+
+    The body is read in chunks into a spooled temp file while it is hashed, so memory stays
+    bounded. Downloads that are not PDFs (by magic bytes) or exceed max_bytes are aborted early.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+
+    async with http_client.stream("GET", url) as resp:
+        if resp.status_code != 200:
+            raise DownloadError("❌ Error downloading file. Please try again.")
+        content_length = int(resp.headers.get("content-length", 0))
+        if content_length > max_bytes:
+            raise DownloadError(f"❌ That file is too large. The limit is {max_bytes // (1024 * 1024)} MB.")
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, dir=dest_dir) as spool:
+            async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                if len(head) < len(PDF_MAGIC):
+                    head += chunk[:len(PDF_MAGIC)]
+                    if len(head) >= len(PDF_MAGIC) and not head.startswith(PDF_MAGIC):
+                        raise DownloadError("❌ Sorry, that file is not a valid PDF.")
+
+                size += len(chunk)
+                if size > max_bytes:
+                    raise DownloadError(f"❌ That file is too large. The limit is {max_bytes // (1024 * 1024)} MB.")
+
+                digest.update(chunk)
+                spool.write(chunk)
+
+            if not head.startswith(PDF_MAGIC):
+                raise DownloadError("❌ Sorry, that file is not a valid PDF.")
+
+            document_hash = digest.hexdigest()
+            path = os.path.join(dest_dir, f"{document_hash}.pdf")
+            await asyncio.to_thread(_persist, spool, path)
+
+    return document_hash, path
+
+
+def _persist(spool, path):
+    if os.path.exists(path):
+        os.utime(path)  # keep a re-uploaded document from being swept as stale
+        return
+
+    spool.seek(0)
+    fd, partial_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        shutil.copyfileobj(spool, f)
+    os.replace(partial_path, path)
@@ -0,0 +1,53 @@
+import math
+import re
+from collections import Counter
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "for", "with", "by", "as", "at",
+    "from", "into", "that", "this", "these", "those", "it", "its", "is", "are", "was", "were", "be",
+    "been", "being", "which", "who", "what", "when", "where", "how", "can", "used", "use", "uses",
+    "such", "also", "their", "they", "there", "than", "then", "so", "some", "any", "each", "other",
+    "has", "have", "had", "do", "does", "very", "type", "kind", "process", "refers",
+}
+# Kept as content words: they flip the meaning of an answer that otherwise matches the reference
+NEGATIONS = {"not", "no", "never", "none", "nor", "neither", "nothing", "without", "cannot"}
+
+SUFFIXES = ("ations", "ation", "ings", "ing", "ies", "ed", "es", "s")
+
+
+def stem(word):
+    """A deliberately crude suffix stripper; enough to match "cells"/"cell" and "produces"/"producing"."""
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def words(text):
+    """Lowercased words of text, with "n't" spelled out as "not"."""
+    return re.findall(r"[a-z0-9]+", re.sub(r"n['’]t\b", " not", text.lower()))
+
+
+def tokenize(text, ignore=()):
+    stems = [stem(w) for w in words(text) if w not in STOPWORDS]
+    return [w for w in stems if w not in ignore]
+
+
+def answer_similarity(answer, reference, term=""):
+    """Cosine similarity of the content-word counts of two texts, in [0, 1].
+
+    Words from the term itself are ignored so restating the question earns nothing. An answer
+    with a negation the reference doesn't have scores 0, since word overlap can't tell "it is
+    X" from "it is not X".
+    """
+    if NEGATIONS.intersection(words(answer)) - NEGATIONS.intersection(words(reference)):
+        return 0.0
+    ignore = set(tokenize(term))
+    a = Counter(tokenize(answer, ignore))
+    b = Counter(tokenize(reference, ignore))
+    if not a or not b:
+        return 0.0
+
+    dot = sum(count * b[word] for word, count in a.items())
+    norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values()))
+    return dot / norm
@@ -0,0 +1,56 @@
+import asyncio
+import contextlib
+from urllib.parse import urlsplit
+
+import httpx
+
+USER_AGENT = "quiz-ai/0.1"
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+PER_HOST_LIMIT = 8  # concurrent requests to any one host
+TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+_client = None
+_host_limits = {}
+
+
+def get_client():
+    """The process-wide client; keeps connections alive and pooled across every caller."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS),
+            timeout=TIMEOUT,
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+        )
+    return _client
+
+
+def _host_limit(url):
+    host = urlsplit(str(url)).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(PER_HOST_LIMIT)
+    return _host_limits[host]
+
+
+async def request(method, url, **kwargs):
+    async with _host_limit(url):
+        return await get_client().request(method, url, **kwargs)
+
+
+@contextlib.asynccontextmanager
+async def stream(method, url, **kwargs):
+    """Like request(), but the body is read incrementally inside the block."""
+    async with _host_limit(url):
+        async with get_client().stream(method, url, **kwargs) as response:
+            yield response
+
+
+async def aclose():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_limits.clear()
@@ -0,0 +1,115 @@
+# Runs the bot as several worker processes, each connected to its own slice of gateway shards.
+# Sessions live in a shared SQLite store, so whichever worker receives a user's message can serve it.
+#
+#   python launcher.py --workers 4
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import http_client
+import scheduler
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger("discord")
+
+DISCORD_API = "https://discord.com/api/v10"
+DEFAULT_SESSION_STORE_PATH = "./cache/sessions.sqlite3"
+IDENTIFY_STAGGER = 5.0  # seconds between worker starts, to respect Discord's identify rate limit
+
+
+async def recommended_shard_count(token):
+    """Asks Discord how many shards the bot should use."""
+    try:
+        response = await http_client.request(
+            "GET", f"{DISCORD_API}/gateway/bot", headers={"Authorization": f"Bot {token}"})
+        response.raise_for_status()
+        return response.json()["shards"]
+    finally:
+        await http_client.aclose()
+
+
+def split_shards(shard_count, workers):
+    """Deals shard ids round-robin so every worker gets a near-equal share."""
+    return [list(range(worker, shard_count, workers)) for worker in range(workers) if worker < shard_count]
+
+
+def split_llm_limits(workers):
+    """Divides the Mistral limits among the workers through the environment they inherit.
+
+    Each worker's scheduler only sees its own calls, so left as they are, the limits would be
+    multiplied by the number of workers.
+    """
+    def share(limit):
+        return max(1, limit // workers)
+
+    os.environ["MISTRAL_MAX_CONCURRENCY"] = str(share(scheduler.MISTRAL_MAX_CONCURRENCY))
+    os.environ["MISTRAL_DEFAULT_MODEL_CONCURRENCY"] = str(share(scheduler.MISTRAL_DEFAULT_MODEL_CONCURRENCY))
+    os.environ["MISTRAL_MODEL_CONCURRENCY"] = json.dumps(
+        {model: share(limit) for model, limit in scheduler.MISTRAL_MODEL_CONCURRENCY.items()})
+    os.environ["MISTRAL_REQUESTS_PER_SECOND"] = str(scheduler.MISTRAL_REQUESTS_PER_SECOND / workers)
+    os.environ["MISTRAL_BURST"] = str(share(scheduler.MISTRAL_BURST))
+
+
+def run_worker(shard_ids, shard_count, token):
+    # Every worker keeps its own metrics, so give each its own export file and port
+    worker = shard_ids[0]  # shards are dealt round-robin, so a worker's first shard is its index
+    if os.getenv("METRICS_PATH"):
+        root, ext = os.path.splitext(os.environ["METRICS_PATH"])
+        os.environ["METRICS_PATH"] = f"{root}.{worker}{ext}"
+    if os.getenv("METRICS_PORT"):
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + worker)
+
+    import bot as bot_module
+
+    logging.basicConfig(level=logging.INFO)
+    bot = bot_module.DiscordBot(shard_ids=shard_ids, shard_count=shard_count)
+    bot.run(token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run QuizAI as sharded worker processes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="total gateway shards (default: Discord's recommendation, at least one per worker)")
+    args = parser.parse_args()
+
+    token = os.getenv("DISCORD_TOKEN")
+    if not token:
+        logger.error("DISCORD_TOKEN not set.")
+        return
+
+    # Workers must share one session store; the in-memory default would be per process
+    os.environ.setdefault("SESSION_STORE_PATH", DEFAULT_SESSION_STORE_PATH)
+
+    shard_count = args.shards or max(asyncio.run(recommended_shard_count(token)), args.workers)
+    assignments = split_shards(shard_count, args.workers)
+    logger.info(f"Starting {len(assignments)} workers for {shard_count} shards")
+    split_llm_limits(len(assignments))
+
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for shard_ids in assignments:
+        process = context.Process(target=run_worker, args=(shard_ids, shard_count, token))
+        process.start()
+        processes.append(process)
+        time.sleep(IDENTIFY_STAGGER)
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import asyncio
+import contextlib
+import os
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "llm_call_seconds": "Latency of LLM calls that missed the cache, including queueing and retries.",
+    "llm_first_token_seconds": "Time until the first token of a streamed LLM reply.",
+    "llm_queue_seconds": "Time LLM calls waited for a scheduler slot.",
+    "llm_tokens_total": "Tokens used by LLM calls.",
+    "llm_errors_total": "LLM calls that failed after retries.",
+    "llm_retries_total": "LLM calls retried after a rate-limit or server error.",
+    "llm_fallbacks_total": "LLM calls retried on a smaller model after missing their latency SLO.",
+    "llm_cache_lookups_total": "LLM response cache lookups by result.",
+    "turn_seconds": "Time to handle one Discord message, by session phase.",
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimates a quantile by interpolating inside the bucket that contains it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return LATENCY_BUCKETS[-1]
+
+
+class Metrics:
+    """Process-wide counters, latency histograms and gauges, keyed by name and label values."""
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> float
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.gauges = {}  # (name, labels) -> zero-argument callable, read at export time
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, read, **labels):
+        self.gauges[self._key(name, labels)] = read
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        for (name, labels), value in sorted(self.counters.items()):
+            describe(name, "counter")
+            lines.append(f"{name}{label_text(labels)} {value}")
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{label_text(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{label_text(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{label_text(labels)} {histogram.count}")
+
+        for (name, labels), read in sorted(self.gauges.items(), key=lambda item: item[0]):
+            describe(name, "gauge")
+            lines.append(f"{name}{label_text(labels)} {read()}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """A short human-readable digest for the !stats command, slowest stages first."""
+        lines = ["**Latency** (count, p50 / p95 / p99)"]
+        by_mean = sorted(self.histograms.items(), key=lambda item: -item[1].sum / max(item[1].count, 1))
+        for (name, labels), h in by_mean:
+            label = ", ".join(str(v) for _, v in labels)
+            lines.append(
+                f"`{name}` {label}: {h.count}, "
+                f"{h.quantile(0.5):.2f}s / {h.quantile(0.95):.2f}s / {h.quantile(0.99):.2f}s")
+
+        totals = {}
+        for (name, labels), value in self.counters.items():
+            if name == "llm_tokens_total":
+                name = f"llm_tokens_total ({dict(labels).get('kind')})"
+            elif name == "llm_cache_lookups_total":
+                name = f"llm_cache_lookups_total ({dict(labels).get('result')})"
+            totals[name] = totals.get(name, 0) + value
+        if totals:
+            lines.append("**Counters**")
+            lines.extend(f"`{name}`: {int(value)}" for name, value in sorted(totals.items()))
+
+        if self.gauges:
+            lines.append("**Gauges**")
+            for (name, labels), read in sorted(self.gauges.items(), key=lambda item: item[0]):
+                lines.append(f"`{name}`: {read():.3g}")
+        return "\n".join(lines)
+
+    def write_prometheus(self, path):
+        """Writes the exposition atomically, for node_exporter's textfile collector or similar."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        partial_path = f"{path}.tmp"
+        with open(partial_path, "w") as f:
+            f.write(self.render_prometheus())
+        os.replace(partial_path, path)
+
+    async def serve(self, port, host="127.0.0.1"):
+        """Serves the exposition over plain HTTP on host:port for a Prometheus scraper."""
+
+        async def handle(reader, writer):
+            try:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass  # the request line and headers don't matter
+                body = self.render_prometheus().encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                    + body)
+                await writer.drain()
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+
+metrics = Metrics()
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from collections import deque
+
+import discord
+
+from metrics import metrics
+
+logger = logging.getLogger("discord")
+
+MESSAGE_LIMIT = 2000  # Discord's maximum message length
+QUOTE = ">>> "  # quotes everything after it, to the end of the message
+SEND_RETRIES = 3  # times a rate-limited send is retried
+
+
+def merge_messages(parts, limit=MESSAGE_LIMIT):
+    """Joins message texts into as few messages as fit within limit, keeping their order.
+
+    A ">>> " block quote runs to the end of its message, so a later part that starts its own quote
+    joins it without the marker, and a part that isn't quoted starts a new message instead. When a
+    quoted message is too long and is split, the continuation is quoted again.
+    """
+    messages = []
+    current = ""
+    for part in parts:
+        part = part.strip("\n") if part else ""
+        if not part.strip():
+            continue
+        quoted = QUOTE in current
+        body = part[len(QUOTE):] if quoted and part.startswith(QUOTE) else part
+        if current and (quoted and body is part or len(current) + 1 + len(body) > limit):
+            messages.append(current)
+            current, body = "", part
+        current = f"{current}\n{body}" if current else body
+        while len(current) > limit:
+            cut = current.rfind("\n", 0, limit)
+            cut = cut if cut > 0 else limit
+            head, current = current[:cut], current[cut:].lstrip("\n")
+            messages.append(head)
+            if QUOTE in head and current:
+                current = QUOTE + current
+    if current:
+        messages.append(current)
+    return messages
+
+
+class Outbox:
+    """Sends messages through one ordered queue per channel.
+
+    Rate-limited (429) sends hold up their channel's queue until Discord's retry-after has
+    passed, then go out again, so later messages never overtake them.
+    """
+
+    def __init__(self):
+        self.queues = {}  # channel id -> deque of (content, future); a queue exists while it's being drained
+        self.drains = set()  # running drain tasks; the event loop only keeps weak references to tasks
+
+    def send(self, channel, content):
+        """Queues content for channel. Returns a future for the sent discord.Message."""
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues.get(channel.id)
+        if queue is None:
+            queue = self.queues[channel.id] = deque()
+            task = asyncio.create_task(self.drain(channel, queue))
+            self.drains.add(task)
+            task.add_done_callback(self.drains.discard)
+        queue.append((content, future))
+        return future
+
+    async def drain(self, channel, queue):
+        try:
+            while queue:
+                content, future = queue.popleft()
+                try:
+                    future.set_result(await self.deliver(channel, content))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            del self.queues[channel.id]
+
+    async def deliver(self, channel, content):
+        for attempt in range(SEND_RETRIES + 1):
+            try:
+                return await channel.send(content)
+            except (discord.RateLimited, discord.HTTPException) as e:
+                if isinstance(e, discord.HTTPException) and e.status != 429 or attempt == SEND_RETRIES:
+                    raise
+                retry_after = getattr(e, "retry_after", None) or float(e.response.headers.get("Retry-After", 1))
+                metrics.inc("discord_rate_limited_total")
+                logger.warning(f"Rate limited sending to channel {channel.id}; retrying in {retry_after:.1f}s")
+                await asyncio.sleep(retry_after)
+
+    def turn(self, channel):
+        return Turn(self, channel)
+
+
+class Turn:
+    """The replies to one message, merged into as few sends as possible when the turn ends.
+
+    Use add() for text that can wait, and send() for a message that must go out now or that is
+    edited later.
+    """
+
+    def __init__(self, outbox, channel):
+        self.outbox = outbox
+        self.channel = channel
+        self.parts = []
+
+    def add(self, content):
+        self.parts.append(content)
+
+    async def send(self, content):
+        """Sends everything added so far, then content as a message of its own, and returns it."""
+        await self.flush()
+        return await self.outbox.send(self.channel, content)
+
+    async def flush(self):
+        futures = [self.outbox.send(self.channel, text) for text in merge_messages(self.parts)]
+        self.parts = []
+        return await asyncio.gather(*futures)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.flush()
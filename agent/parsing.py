@@ -0,0 +1,85 @@
+import difflib
+import json
+import re
+
+FREE_RESPONSE = "Free Response"
+MULTIPLE_CHOICE = "Multiple Choice"
+FILL_IN_THE_BLANK = "Fill-in-the-Blank"
+
+# Numbers follow the order the modes are listed in start_session's prompt
+FORMAT_ALIASES = {
+    "1": FREE_RESPONSE, "free response": FREE_RESPONSE, "free": FREE_RESPONSE, "fr": FREE_RESPONSE,
+    "short answer": FREE_RESPONSE, "open ended": FREE_RESPONSE,
+    "2": MULTIPLE_CHOICE, "multiple choice": MULTIPLE_CHOICE, "multiple": MULTIPLE_CHOICE,
+    "mc": MULTIPLE_CHOICE, "mcq": MULTIPLE_CHOICE,
+    "3": FILL_IN_THE_BLANK, "fill in the blank": FILL_IN_THE_BLANK, "fill in the blanks": FILL_IN_THE_BLANK,
+    "fill in": FILL_IN_THE_BLANK, "fill": FILL_IN_THE_BLANK, "blank": FILL_IN_THE_BLANK,
+    "fitb": FILL_IN_THE_BLANK, "fib": FILL_IN_THE_BLANK,
+}
+FORMAT_MATCH_CUTOFF = 0.8  # difflib ratio needed to accept a misspelled format
+MAX_TERM_WORDS = 3  # the prompts ask for 1-3 word terms; longer items are probably prose
+# First words that mark an item as a request ("help me study ...", "I want ...") rather than a term
+LEAD_IN_WORDS = {
+    "i", "i'm", "im", "me", "my", "we", "we're", "our", "you", "your", "it", "this", "these", "those",
+    "here", "here's", "please", "pls", "help", "quiz", "study", "teach", "test", "review", "practice",
+    "give", "make", "show", "let", "let's", "lets", "can", "could", "would", "will", "want", "need",
+}
+
+
+def _normalize(text):
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+def match_format(user_message):
+    """Maps a format reply such as "mc", "2" or "fill in the blank" to a study format, or None.
+
+    Tries an exact alias, then an alias phrase inside the message ("let's do multiple choice"),
+    then a close misspelling of the whole message ("multple choice").
+    """
+    text = _normalize(user_message)
+    if text in FORMAT_ALIASES:
+        return FORMAT_ALIASES[text]
+
+    padded = f" {text} "
+    found = {study_format for alias, study_format in FORMAT_ALIASES.items()
+             if not alias.isdigit() and f" {alias} " in padded}
+    if len(found) == 1:
+        return found.pop()
+
+    close = difflib.get_close_matches(text, [a for a in FORMAT_ALIASES if len(a) > 3], n=1, cutoff=FORMAT_MATCH_CUTOFF)
+    return FORMAT_ALIASES[close[0]] if close else None
+
+
+def split_terms(user_message):
+    """Splits a plain comma- or newline-separated list into terms, or returns None.
+
+    Strict on purpose: returns None for anything that isn't just a list of short terms (a single
+    item, an item over MAX_TERM_WORDS words, one with a colon, or one that opens like a request
+    such as "I want to study ..."), so the caller can fall back to the LLM.
+    """
+    if "," not in user_message and "\n" not in user_message:
+        return None
+
+    terms = []
+    seen = set()
+    for item in re.split(r"[,\n;]", user_message):
+        # Drop bullets, numbering and a leading "and" from "a, b, and c"
+        term = re.sub(r"^\s*(?:[-*•]+|\d+[.)]|and\b)\s*", "", item).strip().strip(".")
+        if not term:
+            continue
+        words = term.lower().split()
+        if len(words) > MAX_TERM_WORDS or ":" in term or term.endswith(("?", "!")) or words[0] in LEAD_IN_WORDS:
+            return None
+        if term.lower() not in seen:
+            seen.add(term.lower())
+            terms.append(term)
+
+    return terms if len(terms) >= 2 else None
+
+
+def parse_json_object(text):
+    """Parses the first JSON object in an LLM reply, tolerating code fences or prose around it."""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("No JSON object in response")
+    return json.loads(text[start:end + 1])
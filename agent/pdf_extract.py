@@ -0,0 +1,83 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+
+PAGES_PER_TASK = 8  # pages handed to one worker at a time
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+_executor = None
+
+
+def get_executor():
+    """The process pool shared by every extraction, created on first use."""
+    global _executor
+    if _executor is None:
+        # The Discord gateway runs a heartbeat thread, so avoid plain fork() in this process
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def count_pages(pdf_path):
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(pdf_path, start, stop):
+    """Extracts the text of pages [start, stop) (0-based). Runs inside a worker process."""
+    texts = []
+    with pdfplumber.open(pdf_path, pages=range(start + 1, stop + 1)) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text()
+            if page_text:
+                texts.append(page_text)
+    return texts
+
+
+async def extract_pdf_text(pdf_path, max_pages=None, max_chars=None, progress=None):
+    """Extracts a PDF's text across the process pool, keeping page order.
+
+    Page ranges are parsed in parallel. At most max_pages pages are read, and once max_chars
+    characters are collected the remaining ranges are cancelled. progress, if given, is awaited
+    as progress(pages_done, total_pages) after each range.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+
+    total_pages = await loop.run_in_executor(executor, count_pages, pdf_path)
+    if max_pages:
+        total_pages = min(total_pages, max_pages)
+
+    ranges = [(start, min(start + PAGES_PER_TASK, total_pages))
+              for start in range(0, total_pages, PAGES_PER_TASK)]
+    futures = [loop.run_in_executor(executor, extract_page_range, pdf_path, start, stop)
+               for start, stop in ranges]
+
+    texts = []
+    num_chars = 0
+    try:
+        # Await in page order; later ranges keep running in the pool meanwhile
+        for (start, stop), future in zip(ranges, futures):
+            for page_text in await future:
+                texts.append(page_text + "\n")
+                num_chars += len(page_text) + 1
+            if progress:
+                await progress(stop, total_pages)
+            if max_chars and num_chars >= max_chars:
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+
+    text = "".join(texts)
+    return text[:max_chars] if max_chars else text
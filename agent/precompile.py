@@ -0,0 +1,116 @@
+# Builds complete decks ahead of time, so popular subjects and documents are served without any
+# LLM calls at study time. Every card gets a definition, distractors and a fill-in-the-blank
+# sentence, so a deck suits any study format.
+#
+#   python precompile.py "cell biology" "organic chemistry" --pdf syllabus/week1.pdf --workers 4
+#   python precompile.py --subjects-file syllabus.txt --terms 20
+#
+# Decks are written to DECK_DIR, where the bot picks them up: a subject deck when a user sends
+# just the subject, a document deck when a user uploads the same PDF.
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+from agent import DECK_BATCH_SIZE, StudyAgent
+from decks import DECK_DIR, DeckStore, document_key, subject_key
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger("agent")
+
+
+def file_hash(path):
+    """The SHA-256 of a file, the same document hash an upload of it gets."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def build_cards(agent, terms):
+    """Cards with every field for terms, in the same order. Terms the model skipped are left out."""
+    batches = [terms[i:i + DECK_BATCH_SIZE] for i in range(0, len(terms), DECK_BATCH_SIZE)]
+    results = await asyncio.gather(*(agent.generate_deck_cards(batch, None) for batch in batches))
+    cards = {}
+    for batch_cards in results:
+        cards.update(batch_cards)
+    return [cards[term.lower()] for term in terms if term.lower() in cards]
+
+
+async def build_subject_deck(agent, subject, count):
+    terms = await agent.generate_terms_from_subject(subject, count)
+    if not terms:
+        raise RuntimeError("no terms generated")
+    return subject_key(subject), subject, await build_cards(agent, terms)
+
+
+async def build_document_deck(agent, path, count):
+    document_hash = file_hash(path)
+    text = await agent.process_pdf(path, document_hash=document_hash)
+    if text.startswith(("❌", "⚠")):
+        raise RuntimeError(text)
+    terms = await agent.extract_document_terms(text, count)
+    if not terms:
+        raise RuntimeError("no terms extracted")
+    subject = os.path.splitext(os.path.basename(path))[0]
+    return document_key(document_hash), subject, await build_cards(agent, terms)
+
+
+async def run(args):
+    agent = StudyAgent(decks=DeckStore(args.out))
+    jobs = asyncio.Queue()
+    for subject in args.subjects:
+        jobs.put_nowait((subject, build_subject_deck))
+    for path in args.pdf:
+        jobs.put_nowait((path, build_document_deck))
+    failures = []
+
+    async def worker():
+        while not jobs.empty():
+            name, build = jobs.get_nowait()
+            started = time.monotonic()
+            try:
+                key, subject, cards = await build(agent, name, args.terms)
+                if len(cards) < args.min_cards:
+                    raise RuntimeError(f"only {len(cards)} usable cards")
+                path = agent.decks.save(key, subject, cards)
+                print(f"✅ {name}: {len(cards)} cards in {time.monotonic() - started:.1f}s -> {path}")
+            except Exception as e:
+                failures.append(name)
+                print(f"❌ {name}: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, args.workers))))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompile QuizAI decks for subjects and PDFs.")
+    parser.add_argument("subjects", nargs="*", help="subjects to build decks for")
+    parser.add_argument("--subjects-file", help="file with one subject per line")
+    parser.add_argument("--pdf", action="append", default=[], help="PDF to build a deck for (repeatable)")
+    parser.add_argument("--terms", type=int, default=10,
+                        help="terms per deck; a document deck serves sessions of up to this many questions")
+    parser.add_argument("--min-cards", type=int, default=1, help="skip decks with fewer usable cards")
+    parser.add_argument("--workers", type=int, default=4, help="decks built at the same time")
+    parser.add_argument("--out", default=DECK_DIR, help="deck directory (default: DECK_DIR)")
+    args = parser.parse_args()
+
+    if args.subjects_file:
+        with open(args.subjects_file, encoding="utf-8") as f:
+            args.subjects += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not args.subjects and not args.pdf:
+        parser.error("give at least one subject or --pdf")
+
+    logging.basicConfig(level=logging.WARNING)
+    failures = asyncio.run(run(args))
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
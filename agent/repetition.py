@@ -0,0 +1,155 @@
+import heapq
+import os
+import struct
+import time
+from dataclasses import dataclass
+
+REVIEW_LOG_PATH = os.getenv("REVIEW_LOG_PATH", "./cache/reviews.log")  # empty to keep history in memory only
+
+DAY = 24 * 3600
+RELEARN_INTERVAL = 10 * 60  # seconds before a missed card is due again
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+QUALITY_CORRECT = 4  # SM-2 answer quality (0-5) given to right and wrong answers
+QUALITY_WRONG = 1
+
+# One review: user id, unix time, correct, length of the UTF-8 term that follows
+REVIEW_RECORD = struct.Struct("<qd?H")
+
+
+@dataclass(slots=True)
+class Card:
+    term: str
+    repetitions: int = 0  # correct answers in a row
+    interval: float = 0.0  # seconds
+    ease: float = INITIAL_EASE
+    due: float = 0.0
+    lapses: int = 0
+    version: int = 0  # bumped on every review, so older heap entries can be recognized as stale
+
+
+def review(card, correct, now):
+    """Applies one SM-2 review to card."""
+    quality = QUALITY_CORRECT if correct else QUALITY_WRONG
+    card.ease = max(MIN_EASE, card.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if correct:
+        card.repetitions += 1
+        if card.repetitions == 1:
+            card.interval = DAY
+        elif card.repetitions == 2:
+            card.interval = 6 * DAY
+        else:
+            card.interval *= card.ease
+    else:
+        card.repetitions = 0
+        card.interval = RELEARN_INTERVAL
+        card.lapses += 1
+    card.due = now + card.interval
+    card.version += 1
+
+
+class RepetitionScheduler:
+    """Per-user SM-2 card history, with a heap of due dates per user.
+
+    Heap entries are never removed in place: a review pushes a new entry, and entries whose
+    version no longer matches their card are skipped when they surface. Finding due cards costs
+    O(log n) per card, however long the user's history.
+
+    Reviews are appended to a binary log and replayed on start. The log is also re-read from
+    where this process left off before each use, so workers sharing it stay in sync.
+    """
+
+    def __init__(self, path=REVIEW_LOG_PATH):
+        self.path = path
+        self.cards = {}  # user_id -> {lowercased term: Card}
+        self.heaps = {}  # user_id -> heap of (due, version, lowercased term)
+        self.offset = 0  # bytes of the log applied so far
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.refresh()
+
+    def apply(self, user_id, term, correct, now):
+        key = term.lower()
+        cards = self.cards.setdefault(user_id, {})
+        card = cards.get(key)
+        if card is None:
+            card = cards[key] = Card(term)
+        review(card, correct, now)
+
+        heap = self.heaps.setdefault(user_id, [])
+        heapq.heappush(heap, (card.due, card.version, key))
+        if len(heap) > 2 * len(cards) + 16:
+            # Mostly stale entries: rebuild from the live cards
+            heap[:] = [(c.due, c.version, k) for k, c in cards.items()]
+            heapq.heapify(heap)
+
+    def refresh(self):
+        """Applies reviews appended to the log since the last refresh, by this or another process."""
+        if not self.path or not os.path.exists(self.path) or os.path.getsize(self.path) <= self.offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+
+        position = 0
+        while position + REVIEW_RECORD.size <= len(data):
+            user_id, timestamp, correct, length = REVIEW_RECORD.unpack_from(data, position)
+            end = position + REVIEW_RECORD.size + length
+            if end > len(data):
+                break  # a record still being written
+            self.apply(user_id, data[position + REVIEW_RECORD.size:end].decode(errors="replace"), correct, timestamp)
+            position = end
+        self.offset += position
+
+    def record(self, user_id, term, correct, now=None):
+        now = time.time() if now is None else now
+        if not self.path:
+            self.apply(user_id, term, correct, now)
+            return
+
+        encoded = term.encode()[:0xFFFF]
+        record = REVIEW_RECORD.pack(user_id, now, correct, len(encoded)) + encoded
+        # One unbuffered O_APPEND write, so records from concurrent processes don't interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, record)
+        finally:
+            os.close(fd)
+        self.refresh()
+
+    def card(self, user_id, term):
+        self.refresh()
+        return self.cards.get(user_id, {}).get(term.lower())
+
+    def due_terms(self, user_id, limit, now=None):
+        """Up to limit of the user's cards that are due, most overdue first."""
+        self.refresh()
+        now = time.time() if now is None else now
+        heap = self.heaps.get(user_id, [])
+        cards = self.cards.get(user_id, {})
+
+        due = []
+        while heap and len(due) < limit and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            card = cards.get(entry[2])
+            if card is not None and card.version == entry[1]:
+                due.append(entry)
+        for entry in due:
+            heapq.heappush(heap, entry)
+        return [cards[key].term for _, _, key in due]
+
+    def order_terms(self, user_id, terms, now=None):
+        """Orders a session's terms: due cards (most overdue first), then new ones, then the rest by due date."""
+        self.refresh()
+        now = time.time() if now is None else now
+        cards = self.cards.get(user_id, {})
+
+        def priority(term):
+            card = cards.get(term.lower())
+            if card is None:
+                return (1, 0.0)
+            return (0 if card.due <= now else 2, card.due)
+
+        return sorted(terms, key=priority)  # stable, so new cards keep their shuffled order
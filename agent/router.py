@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from metrics import metrics
+
+logger = logging.getLogger("agent")
+
+# Cheapest first, each with the quality tier it reaches
+MISTRAL_MODELS = json.loads(os.getenv(
+    "MISTRAL_MODELS", '[["mistral-tiny", 1], ["mistral-small-latest", 2], ["mistral-large-latest", 3]]'))
+
+# Per task (the call_site passed to StudyAgent.complete): the minimum quality tier, and the
+# latency SLO in seconds a model must meet. A call that runs past its SLO is retried on the
+# next smaller model. MODEL_ROUTES overrides entries, e.g. '{"chunk_terms": {"tier": 2, "slo": 5}}'.
+DEFAULT_ROUTE = {"tier": 1, "slo": 5.0}
+MODEL_ROUTES = {
+    "extract_terms": {"tier": 1, "slo": 3.0},
+    "extract_format": {"tier": 1, "slo": 2.0},
+    "deck_cards": {"tier": 1, "slo": 15.0},
+    "correct_answer": {"tier": 1, "slo": 4.0},
+    "distractors": {"tier": 1, "slo": 4.0},
+    "fill_in_the_blank": {"tier": 1, "slo": 4.0},
+    "grade_answer": {"tier": 1, "slo": 4.0},
+    "chunk_terms": {"tier": 2, "slo": 8.0},  # one call per document chunk, so a model with room for many at once
+    "subject_terms": {"tier": 3, "slo": 8.0},
+}
+MODEL_ROUTES.update(json.loads(os.getenv("MODEL_ROUTES", "{}")))
+
+LATENCY_WINDOW = 50  # recent calls per (task, model) that latency estimates are based on
+LATENCY_PERCENTILE = 0.9  # a model meets an SLO when this share of its recent calls did
+LATENCY_MEMORY = 60.0  # seconds after its last call that a model's estimate is forgotten, so it gets retried
+
+
+class ModelRouter:
+    """Picks the model for each task from its quality tier, latency SLO and recent per-model latency."""
+
+    def __init__(self, models=None, routes=None):
+        self.models = [model for model, _ in (models or MISTRAL_MODELS)]
+        self.tiers = dict(models or MISTRAL_MODELS)
+        self.routes = MODEL_ROUTES if routes is None else routes
+        self.latencies = {}  # (task, model) -> deque of recent seconds
+        self.last_call = {}  # (task, model) -> time.monotonic() of the latest sample
+
+    def route(self, task):
+        return {**DEFAULT_ROUTE, **self.routes.get(task, {})}
+
+    def estimate(self, task, model):
+        """The recent LATENCY_PERCENTILE latency of model on task, or None if nothing recent is known."""
+        samples = self.latencies.get((task, model))
+        if not samples or time.monotonic() - self.last_call[(task, model)] > LATENCY_MEMORY:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(LATENCY_PERCENTILE * len(ordered)))]
+
+    def meets_tier(self, task, model):
+        return self.tiers.get(model, 0) >= self.route(task)["tier"]
+
+    def meets_slo(self, task, model):
+        estimate = self.estimate(task, model)
+        return estimate is None or estimate <= self.route(task)["slo"]
+
+    def choose(self, task):
+        """The cheapest model of the task's tier that meets its SLO.
+
+        When every such model is running slow, the largest smaller model that meets the SLO is
+        used instead, and failing that the cheapest model.
+        """
+        for model in self.models:
+            if self.meets_tier(task, model) and self.meets_slo(task, model):
+                return model
+        for model in reversed(self.models):
+            if not self.meets_tier(task, model) and self.meets_slo(task, model):
+                return model
+        return self.models[0]
+
+    def fallback(self, model):
+        """The next smaller model, or None for the smallest."""
+        index = self.models.index(model) if model in self.models else 0
+        return self.models[index - 1] if index > 0 else None
+
+    def observe(self, task, model, seconds):
+        key = (task, model)
+        if key not in self.latencies:
+            self.latencies[key] = deque(maxlen=LATENCY_WINDOW)
+        self.latencies[key].append(seconds)
+        self.last_call[key] = time.monotonic()
+
+    async def call(self, task, call):
+        """Returns await call(model, timeout) for the chosen model.
+
+        call must apply timeout (the task's SLO, or None for no deadline) to the model's own
+        response time, not to time spent waiting for a scheduler slot, and raise TimeoutError
+        past it; it reports its latency with observe(). A call that misses the SLO is made again
+        on the next smaller model without a deadline.
+        """
+        model = self.choose(task)
+        fallback = self.fallback(model)
+        slo = self.route(task)["slo"]
+        try:
+            return await call(model, slo if fallback else None)
+        except TimeoutError:
+            self.observe(task, model, slo)
+            metrics.inc("llm_fallbacks_total", call_site=task, model=model)
+            logger.warning(f"{task} on {model} missed its {slo:.0f}s SLO; retrying on {fallback}")
+            return await call(fallback, None)
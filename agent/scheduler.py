@@ -0,0 +1,179 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+from metrics import metrics
+
+# Lower values are served first when requests queue up
+PRIORITY_INTERACTIVE = 0  # a user is waiting on this turn (grading, format, on-demand questions)
+PRIORITY_SETUP = 1  # session setup work such as term extraction and deck compiles
+PRIORITY_PREFETCH = 2  # questions built ahead of time in the background
+
+# Limits for this process. launcher.py divides them among its workers, so together they stay
+# within what is configured here (except that each worker keeps at least 1 of every limit).
+MISTRAL_MAX_CONCURRENCY = int(os.getenv("MISTRAL_MAX_CONCURRENCY", "8"))
+MISTRAL_MODEL_CONCURRENCY = json.loads(os.getenv("MISTRAL_MODEL_CONCURRENCY", '{"mistral-large-latest": 2}'))
+MISTRAL_DEFAULT_MODEL_CONCURRENCY = int(os.getenv("MISTRAL_DEFAULT_MODEL_CONCURRENCY", "6"))
+MISTRAL_REQUESTS_PER_SECOND = float(os.getenv("MISTRAL_REQUESTS_PER_SECOND", "5"))
+MISTRAL_BURST = int(os.getenv("MISTRAL_BURST", "10"))
+MISTRAL_MAX_RETRIES = int(os.getenv("MISTRAL_MAX_RETRIES", "4"))
+
+current_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextlib.contextmanager
+def llm_priority(priority):
+    """Runs the enclosed LLM calls, and tasks created inside the block, at the given priority."""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def is_rate_limited(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if status == 429 or (isinstance(status, int) and 500 <= status < 600):
+        return True
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+
+class MistralScheduler:
+    """Admits LLM calls under global and per-model concurrency limits and a token-bucket rate limit.
+
+    Waiting calls are served in priority order. Rate-limit (429) and server errors are retried
+    with jittered exponential backoff, honoring Retry-After when the API sends one.
+    """
+
+    def __init__(self, max_concurrency=MISTRAL_MAX_CONCURRENCY, model_concurrency=None,
+                 default_model_concurrency=MISTRAL_DEFAULT_MODEL_CONCURRENCY,
+                 requests_per_second=MISTRAL_REQUESTS_PER_SECOND, burst=MISTRAL_BURST,
+                 max_retries=MISTRAL_MAX_RETRIES, base_delay=0.5, max_delay=30.0):
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = MISTRAL_MODEL_CONCURRENCY if model_concurrency is None else model_concurrency
+        self.default_model_concurrency = default_model_concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.active = 0
+        self.active_by_model = defaultdict(int)
+        self._waiters = []  # heap of (priority, sequence, model, future)
+        self._sequence = itertools.count()
+        self._tokens = float(burst)
+        self._tokens_updated = time.monotonic()
+
+        self.retries = 0
+        self.failures = 0
+
+    def concurrency(self, model):
+        """How many calls to model can run at once."""
+        return min(self.max_concurrency, self.model_concurrency.get(model, self.default_model_concurrency))
+
+    def _has_capacity(self, model):
+        return self.active < self.max_concurrency and self.active_by_model[model] < self.concurrency(model)
+
+    def _dispatch(self):
+        """Hands free slots to the highest-priority waiters whose model has room."""
+        blocked = []
+        while self._waiters and self.active < self.max_concurrency:
+            entry = heapq.heappop(self._waiters)
+            priority, _, model, future = entry
+            if future.done():  # the waiter was cancelled
+                continue
+            if not self._has_capacity(model):
+                blocked.append(entry)
+                continue
+            self.active += 1
+            self.active_by_model[model] += 1
+            future.set_result(None)
+        for entry in blocked:
+            heapq.heappush(self._waiters, entry)
+
+    def _release(self, model):
+        self.active -= 1
+        self.active_by_model[model] -= 1
+        self._dispatch()
+
+    async def _acquire(self, model, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), model, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(model)  # granted a slot just as we were cancelled
+            raise
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._tokens_updated) * self.requests_per_second)
+            self._tokens_updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.requests_per_second)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, model, priority=None):
+        """Holds one request slot for model, e.g. for the lifetime of a streamed response."""
+        priority = current_priority.get() if priority is None else priority
+        started = time.perf_counter()
+        await self._acquire(model, priority)
+        try:
+            await self._take_token()
+            metrics.observe("llm_queue_seconds", time.perf_counter() - started, model=model, priority=priority)
+            yield
+        finally:
+            self._release(model)
+
+    def backoff_delay(self, attempt, error):
+        response = getattr(error, "raw_response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        # "Full jitter": spreads retries out so clients that failed together don't retry together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(self, model, call, priority=None, timeout=None):
+        """Returns await call(), run inside a slot for model and retried on transient errors.
+
+        timeout bounds each attempt from when it gets its slot, so time spent queued doesn't count
+        against it. An attempt that runs past it raises TimeoutError and is not retried.
+        """
+        attempt = 0
+        while True:
+            async with self.slot(model, priority):
+                try:
+                    return await asyncio.wait_for(call(), timeout)
+                except Exception as e:
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        self.failures += 1
+                        raise
+                    delay = self.backoff_delay(attempt, e)
+                    error = type(e).__name__
+            # Wait outside the slot so other requests can use it meanwhile
+            self.retries += 1
+            metrics.inc("llm_retries_total", model=model, error=error)
+            attempt += 1
+            await asyncio.sleep(delay)
@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, fields
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(6 * 3600)))  # seconds of inactivity before a session is dropped
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH")  # SQLite file; in-memory sessions when unset
+
+
+@dataclass(slots=True)
+class Session:
+    """One user's study session, from PDF upload through the last question."""
+
+    terms: list = field(default_factory=list)
+    current_term: int = 0
+    subject: str = ""
+    format: str | None = None
+    setup: bool = False
+    num_questions: int | None = None
+    deck: list | None = None  # cards from compile_deck or a precompiled deck, aligned with terms
+    mcq_options: list | None = None
+    correct_answer: int | None = None
+    pending_pdf: list | None = None  # [document_hash, path] awaiting a yes/no
+    document_hash: str | None = None
+    awaiting_question_count: bool = False
+
+    @property
+    def phase(self):
+        """The step of the study flow the user's next message is for.
+
+        A pending PDF upload is not a phase of its own: only a yes/no reply is taken as its answer.
+        """
+        if self.awaiting_question_count:
+            return "awaiting_count"
+        if not self.terms:
+            return "new"
+        return "setup" if self.setup else "answering"
+
+    @property
+    def question_count(self):
+        if self.num_questions is None:
+            return len(self.terms)
+        return min(self.num_questions, len(self.terms))
+
+    def to_json(self):
+        return json.dumps(asdict(self), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data):
+        values = json.loads(data)
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in values.items() if k in names})
+
+
+class SessionStore:
+    """Where sessions live. Sessions not saved for longer than ttl seconds are treated as gone.
+
+    get() may return a fresh copy, so callers must save() a session after changing it.
+    """
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def save(self, user_id, session):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    def evict_idle(self):
+        """Removes idle sessions and returns the ids of their users."""
+        raise NotImplementedError
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in a dict ordered by last save, so eviction only looks at the idle end."""
+
+    def __init__(self, ttl=SESSION_TTL):
+        super().__init__(ttl)
+        self._sessions = OrderedDict()  # user_id -> (last saved, Session)
+
+    def get(self, user_id):
+        entry = self._sessions.get(user_id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def save(self, user_id, session):
+        self._sessions[user_id] = (time.monotonic(), session)
+        self._sessions.move_to_end(user_id)
+
+    def delete(self, user_id):
+        self._sessions.pop(user_id, None)
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.ttl
+        evicted = []
+        while self._sessions:
+            user_id, (saved_at, _) = next(iter(self._sessions.items()))
+            if saved_at >= cutoff:
+                break
+            del self._sessions[user_id]
+            evicted.append(user_id)
+        return evicted
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SqliteSessionStore(SessionStore):
+    """Sessions persisted in SQLite, so they survive restarts and can be shared between processes."""
+
+    def __init__(self, path, ttl=SESSION_TTL):
+        super().__init__(ttl)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, saved_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sessions_saved_at ON sessions (saved_at)")
+
+    def get(self, user_id):
+        row = self.conn.execute(
+            "SELECT data FROM sessions WHERE user_id = ? AND saved_at >= ?",
+            (user_id, time.time() - self.ttl),
+        ).fetchone()
+        return Session.from_json(row[0]) if row else None
+
+    def save(self, user_id, session):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sessions (user_id, data, saved_at) VALUES (?, ?, ?)",
+            (user_id, session.to_json(), time.time()),
+        )
+
+    def delete(self, user_id):
+        self.conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def evict_idle(self):
+        rows = self.conn.execute(
+            "DELETE FROM sessions WHERE saved_at < ? RETURNING user_id", (time.time() - self.ttl,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def create_session_store():
+    """The SQLite store when SESSION_STORE_PATH is set, otherwise the in-memory one."""
+    if SESSION_STORE_PATH:
+        return SqliteSessionStore(SESSION_STORE_PATH)
+    return MemorySessionStore()
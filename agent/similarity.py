@@ -0,0 +1,86 @@
+import re
+
+import numpy as np
+
+from grading import tokenize
+
+
+TERM_MASK = "___"
+
+
+def mask_terms(text, terms):
+    """text with every mention of terms (and their plurals) replaced by TERM_MASK.
+
+    Definitions name their own term, so shown as options they would point straight at the answer.
+    """
+    names = sorted({term.strip() for term in terms if term.strip()}, key=len, reverse=True)
+    if not names:
+        return text
+    pattern = r"\b(?:" + "|".join(re.escape(name) for name in names) + r")(?:s|es)?\b"
+    return re.sub(pattern, TERM_MASK, text, flags=re.IGNORECASE)
+
+
+def tfidf_matrix(texts):
+    """L2-normalized TF-IDF vectors of texts, one row each, over their content words."""
+    documents = [tokenize(text) for text in texts]
+    vocabulary = {}
+    for words in documents:
+        for word in words:
+            vocabulary.setdefault(word, len(vocabulary))
+
+    counts = np.zeros((len(documents), len(vocabulary)))
+    for row, words in enumerate(documents):
+        for word in words:
+            counts[row, vocabulary[word]] += 1
+
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+    vectors = counts * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def closest_definitions(definition, others, count=3):
+    """The count definitions in others most similar to definition, most similar first.
+
+    Scores only the one row needed. Returns None if others has too few distinct definitions
+    that differ from definition.
+    """
+    key = definition.strip().lower()
+    vectors = tfidf_matrix([definition, *others])
+    scores = vectors[1:] @ vectors[0]
+
+    chosen = {key: None}  # normalized definition -> index; skips duplicates and definition itself
+    for index in np.argsort(-scores, kind="stable"):
+        if len(chosen) > count:
+            break
+        chosen.setdefault(others[index].strip().lower(), index)
+    picks = [others[index] for index in chosen.values() if index is not None]
+    return picks if len(picks) == count else None
+
+
+def pick_distractors(definitions, count=3):
+    """For each definition, the count other definitions most similar to it, most similar first.
+
+    All pairs are scored in one matrix product. Returns a list of lists aligned with definitions,
+    or None if there are too few distinct definitions to go around.
+    """
+    distinct = {definition.strip().lower() for definition in definitions}
+    if len(distinct) <= count:
+        return None
+
+    vectors = tfidf_matrix(definitions)
+    scores = vectors @ vectors.T
+    # Never offer a definition (or a duplicate of it) as a distractor for itself
+    keys = np.array([definition.strip().lower() for definition in definitions])
+    scores[keys[:, None] == keys[None, :]] = -np.inf
+
+    picks = []
+    for row in scores:
+        chosen = {}  # normalized definition -> index, so duplicates of each other aren't both picked
+        for index in np.argsort(-row, kind="stable"):
+            if len(chosen) == count or row[index] == -np.inf:
+                break
+            chosen.setdefault(keys[index], index)
+        picks.append([definitions[index] for index in chosen.values()])
+    return picks
@@ -0,0 +1,77 @@
+import math
+import re
+
+CHARS_PER_TOKEN = 4  # rough average for English text
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_into_chunks(text, max_tokens):
+    """Splits text into chunks of about max_tokens tokens, breaking on line boundaries where possible."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    current_len = 0
+
+    for line in text.splitlines(keepends=True):
+        # A single oversized line (e.g. text without newlines) is cut into pieces
+        while len(line) > max_chars:
+            if current:
+                chunks.append("".join(current))
+                current, current_len = [], 0
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+
+        if current_len + len(line) > max_chars and current:
+            chunks.append("".join(current))
+            current, current_len = [], 0
+        current.append(line)
+        current_len += len(line)
+
+    if current:
+        chunks.append("".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def spread_sample(items, limit):
+    """Picks up to limit items spread evenly across the list, keeping their order."""
+    if len(items) <= limit:
+        return items
+    step = len(items) / limit
+    return [items[int(i * step)] for i in range(limit)]
+
+
+def parse_term_lines(response_text):
+    """Turns a one-term-per-line LLM reply into clean terms, dropping bullets and numbering."""
+    terms = []
+    for line in response_text.split("\n"):
+        term = re.sub(r"^\s*(?:[-*•]+|\d+[.)])\s*", "", line).strip().strip("*").strip()
+        if term:
+            terms.append(term)
+    return terms
+
+
+def rank_terms(candidate_lists, limit):
+    """Merges per-chunk term lists into the top `limit` terms.
+
+    Terms proposed by more chunks rank first; ties go to terms the chunks listed earlier.
+    Duplicates are matched case-insensitively and keep their first spelling.
+    """
+    votes = {}
+    positions = {}
+    spelling = {}
+    for candidates in candidate_lists:
+        seen = set()
+        for position, term in enumerate(candidates):
+            key = term.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            spelling.setdefault(key, term)
+            votes[key] = votes.get(key, 0) + 1
+            positions[key] = positions.get(key, 0) + position
+
+    ranked = sorted(votes, key=lambda key: (-votes[key], positions[key] / votes[key]))
+    return [spelling[key] for key in ranked[:limit]]
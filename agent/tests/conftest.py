@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# agent.py and repetition.py read these at import time; keep tests away from ./cache
+_cache_dir = tempfile.mkdtemp(prefix="quizai-tests-")
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(_cache_dir, "llm.sqlite3"))
+os.environ.setdefault("DOCUMENT_CACHE_PATH", os.path.join(_cache_dir, "documents.sqlite3"))
+os.environ.setdefault("REVIEW_LOG_PATH", "")
+os.environ.setdefault("DECK_DIR", os.path.join(_cache_dir, "decks"))
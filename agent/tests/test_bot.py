@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from benchmark import FakeMistral, SimulatedChannel, SimulatedMessage, SimulatedUser
+from bot import DiscordBot
+
+
+@pytest.fixture
+def bot():
+    bot = DiscordBot()
+    bot._connection.user = SimulatedUser(1, bot=True)
+    bot.study_agent.mistral = FakeMistral(latency=0.05, jitter=0, token_latency=0)
+    return bot
+
+
+def test_answers_sent_together_are_handled_in_order(bot):
+    user = SimulatedUser(42)
+    channel = SimulatedChannel(42)
+
+    def say(content):
+        return bot.on_message(SimulatedMessage(user, channel, content))
+
+    async def study():
+        await say("osmosis, diffusion, ribosome, enzyme")
+        await say("free response")
+        terms = bot.study_agent.sessions.get(user.id).terms
+        channel.replies.clear()
+        await asyncio.gather(say("water moving through a membrane"), say("particles spreading out"))
+        return terms
+
+    terms = asyncio.run(study())
+
+    session = bot.study_agent.sessions.get(user.id)
+    assert session.current_term == 2
+    # Each answer was graded against its own term
+    assert bot.study_agent.repetition.card(user.id, terms[0]) is not None
+    assert bot.study_agent.repetition.card(user.id, terms[1]) is not None
+    replies = "\n".join(channel.replies)
+    assert replies.count("Next question") == 2
+    assert replies.index(f"'{terms[1]}'") < replies.index(f"'{terms[2]}'")
+    assert not bot.user_locks
@@ -0,0 +1,38 @@
+import pytest
+
+from agent import GRADE_ACCEPT_THRESHOLD
+from grading import answer_similarity
+
+REFERENCE = "Osmosis is the movement of water across a semipermeable membrane."
+
+
+@pytest.mark.parametrize("answer", [
+    "the movement of water across a semipermeable membrane",
+    "Movement of water across semipermeable membranes",
+])
+def test_close_answers_are_accepted(answer):
+    assert answer_similarity(answer, REFERENCE, "osmosis") >= GRADE_ACCEPT_THRESHOLD
+
+
+@pytest.mark.parametrize("answer", [
+    "it is not the movement of water across a semipermeable membrane",
+    "it isn't the movement of water across a semipermeable membrane",
+    "never the movement of water across a semipermeable membrane",
+    "no movement of water across a semipermeable membrane",
+])
+def test_negated_copies_are_not_accepted(answer):
+    assert answer_similarity(answer, REFERENCE, "osmosis") < GRADE_ACCEPT_THRESHOLD
+
+
+def test_negation_shared_with_the_reference_still_matches():
+    reference = "A cell without a nucleus."
+    assert answer_similarity("a cell without any nucleus", reference, "prokaryote") >= GRADE_ACCEPT_THRESHOLD
+
+
+def test_restating_the_term_earns_nothing():
+    assert answer_similarity("osmosis", REFERENCE, "osmosis") == 0.0
+
+
+def test_paraphrases_fall_below_the_threshold():
+    reference = "The mitochondria is the powerhouse of the cell, producing ATP through cellular respiration."
+    assert answer_similarity("organelle that makes energy for the body", reference, "mitochondria") < GRADE_ACCEPT_THRESHOLD
@@ -0,0 +1,61 @@
+import asyncio
+
+from benchmark import SimulatedChannel
+from outbox import MESSAGE_LIMIT, QUOTE, Outbox, merge_messages
+
+
+def test_parts_are_joined_in_order():
+    assert merge_messages(["a", "b", "", "  ", "c"]) == ["a\nb\nc"]
+
+
+def test_parts_that_dont_fit_start_a_new_message():
+    parts = ["x" * 1500, "y" * 600, "z"]
+    assert merge_messages(parts) == ["x" * 1500, "y" * 600 + "\nz"]
+
+
+def test_quotes_join_without_a_second_marker():
+    assert merge_messages(["a", ">>> b", ">>> c"]) == ["a\n>>> b\nc"]
+
+
+def test_unquoted_part_after_a_quote_starts_a_new_message():
+    assert merge_messages([">>> a", "b", ">>> c"]) == [">>> a", "b\n>>> c"]
+
+
+def test_long_part_is_split_at_line_breaks():
+    lines = [f"line {i} " + "w" * 40 for i in range(100)]
+    messages = merge_messages(["\n".join(lines)])
+
+    assert len(messages) > 1
+    assert all(len(message) <= MESSAGE_LIMIT for message in messages)
+    assert "\n".join(messages).split("\n") == lines
+
+
+def test_long_quoted_part_keeps_quoting_its_continuation():
+    text = QUOTE + "\n".join("q" * 50 for _ in range(100))
+    messages = merge_messages(["intro", text])
+
+    assert messages[0] == "intro"
+    assert len(messages) > 2
+    assert all(len(message) <= MESSAGE_LIMIT for message in messages)
+    assert all(message.startswith(QUOTE) for message in messages[1:])
+
+
+def test_long_line_without_breaks_is_cut_at_the_limit():
+    messages = merge_messages(["z" * (2 * MESSAGE_LIMIT + 10)])
+    assert [len(message) for message in messages] == [MESSAGE_LIMIT, MESSAGE_LIMIT, 10]
+
+
+def test_outbox_sends_in_order_and_keeps_its_drain_task():
+    channel = SimulatedChannel(1)
+
+    async def send():
+        outbox = Outbox()
+        futures = [outbox.send(channel, f"message {i}") for i in range(5)]
+        assert len(outbox.drains) == 1
+        await asyncio.gather(*futures)
+        await asyncio.sleep(0)
+        return outbox
+
+    outbox = asyncio.run(send())
+    assert channel.replies == [f"message {i}" for i in range(5)]
+    assert not outbox.drains and not outbox.queues
@@ -0,0 +1,26 @@
+import pytest
+
+from parsing import split_terms
+
+
+@pytest.mark.parametrize("message, terms", [
+    ("photosynthesis, mitochondria, ribosomes", ["photosynthesis", "mitochondria", "ribosomes"]),
+    ("cells, DNA, and RNA", ["cells", "DNA", "RNA"]),
+    ("- osmosis\n- diffusion\n- active transport", ["osmosis", "diffusion", "active transport"]),
+    ("1. mitosis\n2. meiosis\n3. Mitosis", ["mitosis", "meiosis"]),
+])
+def test_splits_plain_lists(message, terms):
+    assert split_terms(message) == terms
+
+
+@pytest.mark.parametrize("message", [
+    "photosynthesis",
+    "I want to study photosynthesis, mitochondria and ribosomes",
+    "Help me study biology: cells, DNA, and RNA",
+    "quiz me on these terms\nosmosis\ndiffusion",
+    "biology terms: cells, DNA",
+    "osmosis, the movement of water across a membrane",
+    "what is osmosis?, diffusion",
+])
+def test_leaves_prose_to_the_llm(message):
+    assert split_terms(message) is None
@@ -0,0 +1,54 @@
+import re
+
+from agent import StudyAgent
+from similarity import TERM_MASK, closest_definitions, mask_terms, pick_distractors
+
+DECK = {
+    "osmosis": "Osmosis is the movement of water across a semipermeable membrane.",
+    "diffusion": "Diffusion is the spreading of particles from high to low concentration.",
+    "active transport": "Active transport moves molecules across a membrane using energy, unlike diffusion.",
+    "ribosome": "A ribosome is the organelle that builds proteins.",
+    "mitochondria": "Mitochondria are organelles that produce ATP, powering active transport.",
+    "enzyme": "An enzyme is a protein that speeds up reactions.",
+    "nucleus": "The nucleus is the organelle that holds DNA and directs ribosomes.",
+}
+
+
+def mentions(text, term):
+    return re.search(rf"\b{re.escape(term)}", text, re.IGNORECASE) is not None
+
+
+def test_mask_terms_masks_names_and_plurals():
+    text = "Ribosomes build proteins; an Enzyme speeds up reactions."
+    assert mask_terms(text, ["ribosome", "enzyme"]) == f"{TERM_MASK} build proteins; an {TERM_MASK} speeds up reactions."
+
+
+def test_mask_terms_masks_longer_names_first():
+    assert mask_terms("Active transport uses energy.", ["transport", "active transport"]) == f"{TERM_MASK} uses energy."
+
+
+def test_deck_distractors_name_no_deck_term():
+    cards = {term: {"term": term, "definition": definition} for term, definition in DECK.items()}
+    StudyAgent.add_deck_distractors(None, cards, list(DECK))
+
+    assert set(cards) == set(DECK)
+    for term, card in cards.items():
+        assert len(card["distractors"]) == 3
+        assert DECK[term] not in card["distractors"]
+        for distractor in card["distractors"]:
+            assert not any(mentions(distractor, other) for other in DECK), distractor
+
+
+def test_pick_distractors_prefers_similar_definitions():
+    definitions = [mask_terms(definition, DECK) for definition in DECK.values()]
+    picks = pick_distractors(definitions)
+
+    # Osmosis is closest to the other definition about crossing a membrane
+    assert picks[0][0] == definitions[2]
+    assert definitions[6] in picks[3]  # and the ribosome to another organelle
+
+
+def test_too_few_distinct_definitions():
+    assert pick_distractors(["a cell", "A cell", "a gene", "a protein"]) is None
+    assert closest_definitions("a cell", ["a gene", "A gene", "a protein"]) is None
+    assert closest_definitions("a cell", ["a gene", "a protein", "a lipid"]) is not None
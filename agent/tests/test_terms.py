@@ -0,0 +1,48 @@
+import asyncio
+import logging
+
+import pytest
+
+import agent
+from agent import MAX_PDF_CHARS, StudyAgent
+
+
+@pytest.fixture
+def study_agent(monkeypatch):
+    study_agent = StudyAgent()
+    chunks = []
+
+    async def extract_chunk_terms(text, count):
+        chunks.append(text)
+        return [f"term{len(chunks)}"]
+
+    monkeypatch.setattr(study_agent, "extract_chunk_terms", extract_chunk_terms)
+    return study_agent, chunks
+
+
+def document(chars):
+    line = "Osmosis moves water across a membrane.\n"
+    return line * (chars // len(line))
+
+
+def test_reads_all_of_the_longest_document(study_agent, caplog):
+    study_agent, chunks = study_agent
+    text = document(MAX_PDF_CHARS)
+
+    with caplog.at_level(logging.WARNING, logger="agent"):
+        asyncio.run(study_agent.extract_document_terms(text, 10))
+
+    assert sum(len(chunk) for chunk in chunks) == len(text)
+    assert "was not read" not in caplog.text
+
+
+def test_logs_the_share_left_unread(study_agent, monkeypatch, caplog):
+    study_agent, chunks = study_agent
+    monkeypatch.setattr(agent, "MAX_TERM_CHUNKS", 4)
+    text = document(MAX_PDF_CHARS)
+
+    with caplog.at_level(logging.WARNING, logger="agent"):
+        asyncio.run(study_agent.extract_document_terms(text, 10))
+
+    assert len(chunks) == 4
+    assert "% of its text was not read" in caplog.text
@@ -0,0 +1,103 @@
+import asyncio
+import json
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import http_client
+from tools import weather
+
+
+def forecast(latitude):
+    return {
+        "current": {"temperature_2m": latitude},
+        "daily": {
+            "time": ["2025-01-01"],
+            "weather_code": [0],
+            "temperature_2m_max": [60],
+            "temperature_2m_min": [40],
+            "precipitation_probability_max": [10],
+        },
+    }
+
+
+async def serve_forecasts(requests):
+    """A local stand-in for Open-Meteo that records the query of every request it gets."""
+
+    async def handle(reader, writer):
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        query = parse_qs(urlsplit(request_line.split()[1].decode()).query)
+        requests.append(query)
+        latitudes = query["latitude"][0].split(",")
+        data = [forecast(float(latitude)) for latitude in latitudes]
+        body = json.dumps(data if len(data) > 1 else data[0]).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    requests = []
+    monkeypatch.setattr(weather, "_forecast_cache", {})
+
+    async def run(coroutine_function):
+        server = await serve_forecasts(requests)
+        port = server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(weather, "WEATHER_API_BASE", f"http://127.0.0.1:{port}/v1/forecast?daily=x")
+        try:
+            return await coroutine_function()
+        finally:
+            server.close()
+            await http_client.aclose()
+
+    return requests, lambda coroutine_function: asyncio.run(run(coroutine_function))
+
+
+def test_batches_locations_into_one_request(stub_api):
+    requests, run = stub_api
+    locations = [("37.77", "-122.42"), ("40.71", "-74.01"), ("51.51", "-0.13"), ("35.68", "139.69")]
+
+    results = run(lambda: weather.seven_day_forecasts(locations))
+
+    assert len(requests) == 1
+    assert [json.loads(result)["current"]["temperature_2m"] for result in results] == [37.77, 40.71, 51.51, 35.68]
+
+
+def test_repeats_are_served_from_cache(stub_api):
+    requests, run = stub_api
+
+    async def twice():
+        first = await weather.seven_day_forecast("37.77", "-122.42")
+        second = await weather.seven_day_forecast("37.7701", "-122.4199")  # rounds to the same key
+        return first, second
+
+    first, second = run(twice)
+
+    assert len(requests) == 1
+    assert first == second
+
+
+def test_bad_coordinates_return_an_error(stub_api):
+    requests, run = stub_api
+
+    assert run(lambda: weather.seven_day_forecast("abc", "4")) == "Error fetching weather data"
+    assert requests == []
+
+
+def test_bad_locations_dont_fail_the_batch(stub_api):
+    requests, run = stub_api
+    locations = [("37.77", "-122.42"), ("95", "10"), ("40.71", "-200"), ("nan", "0"), ("51.51", "-0.13")]
+
+    results = run(lambda: weather.seven_day_forecasts(locations))
+
+    assert len(requests) == 1
+    assert requests[0]["latitude"] == ["37.77,51.51"]
+    assert results[1:4] == ["Error fetching weather data"] * 3
+    assert json.loads(results[0])["current"]["temperature_2m"] == 37.77
+    assert json.loads(results[4])["current"]["temperature_2m"] == 51.51
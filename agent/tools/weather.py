@@ -1,44 +1,63 @@
-import httpx
+import asyncio
 import logging
 import json
+import time
+
+import http_client
 
 USER_AGENT = "weather-app/1.0"
 WEATHER_API_BASE = "https://api.open-meteo.com/v1/forecast?current=temperature_2m,precipitation,weather_code&daily=weather_code,temperature_2m_max,temperature_2m_min,precipitation_probability_max&temperature_unit=fahrenheit&wind_speed_unit=mph&precipitation_unit=inch&timezone=America%2FLos_Angeles"
+FORECAST_TTL = 3600  # seconds; Open-Meteo forecasts update hourly
+COORDINATE_PRECISION = 2  # decimal places kept in cache keys (about 1 km)
+MAX_LOCATIONS_PER_REQUEST = 50
+MAX_CACHED_FORECASTS = 1024
 
 
 logger = logging.getLogger("discord")
 
+_forecast_cache = {}  # (latitude, longitude) rounded -> (fetched at, forecast JSON)
+
 
-def _make_request(url: str):
+async def _make_request(url: str):
     headers = {"User-Agent": USER_AGENT, "Accept": "application/geo+json"}
 
     try:
-        response = httpx.Client().get(url, headers=headers, timeout=5.0)
+        response = await http_client.request("GET", url, headers=headers, timeout=5.0)
         response.raise_for_status()
         return response.json()
     except Exception:
         return None
 
 
-def seven_day_forecast(latitude: str, longitude: str):
-    """Get the seven day forecast for a given location with latitude and longitude."""
-    logger.info(f"Getting seven day forecast for {latitude}, {longitude}")
-    url = f"{WEATHER_API_BASE}&latitude={latitude}&longitude={longitude}"
-    data = _make_request(url)
+def _cache_key(latitude, longitude):
+    """Rounded coordinates. Raises ValueError for coordinates Open-Meteo would reject, since one
+    bad location fails a whole batched request."""
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError(f"Coordinates out of range: {latitude}, {longitude}")
+    return (round(latitude, COORDINATE_PRECISION), round(longitude, COORDINATE_PRECISION))
 
-    if data is None:
-        return "Error fetching weather data"
 
+def _cache_forecast(key, forecast, now):
+    if len(_forecast_cache) >= MAX_CACHED_FORECASTS:
+        for stale_key in [k for k, (fetched_at, _) in _forecast_cache.items() if now - fetched_at >= FORECAST_TTL]:
+            del _forecast_cache[stale_key]
+        if len(_forecast_cache) >= MAX_CACHED_FORECASTS:
+            del _forecast_cache[next(iter(_forecast_cache))]  # oldest insertion
+    _forecast_cache[key] = (now, forecast)
+
+
+def _format_forecast(data):
     res_json = {
         "current": data["current"],
         "daily": {},
     }
 
-    for i, time in enumerate(data["daily"]["time"]):
+    for i, day in enumerate(data["daily"]["time"]):
         max_temp = data["daily"]["temperature_2m_max"][i]
         min_temp = data["daily"]["temperature_2m_min"][i]
         precipitation = data["daily"]["precipitation_probability_max"][i]
-        res_json["daily"][time] = {
+        res_json["daily"][day] = {
             "weather_code": data["daily"]["weather_code"][i],
             "temperature_max": f"{max_temp}°F",
             "temperature_min": f"{min_temp}°F",
@@ -46,3 +65,58 @@ def seven_day_forecast(latitude: str, longitude: str):
         }
 
     return json.dumps(res_json)
+
+
+async def _fetch_forecasts(keys):
+    """One Open-Meteo request for several locations; it answers with a list when given more than one."""
+    latitudes = ",".join(str(latitude) for latitude, _ in keys)
+    longitudes = ",".join(str(longitude) for _, longitude in keys)
+    data = await _make_request(f"{WEATHER_API_BASE}&latitude={latitudes}&longitude={longitudes}")
+    if data is None:
+        return [None] * len(keys)
+    locations = data if isinstance(data, list) else [data]
+    return [_format_forecast(location) for location in locations]
+
+
+async def seven_day_forecast(latitude: str, longitude: str):
+    """Get the seven day forecast for a given location with latitude and longitude."""
+    logger.info(f"Getting seven day forecast for {latitude}, {longitude}")
+    return (await seven_day_forecasts([(latitude, longitude)]))[0]
+
+
+async def seven_day_forecasts(locations):
+    """Get seven day forecasts for a list of (latitude, longitude) pairs, in the same order.
+
+    Forecasts fetched within the last FORECAST_TTL seconds are served from memory; the rest are
+    fetched together, MAX_LOCATIONS_PER_REQUEST locations per request.
+    """
+    now = time.monotonic()
+    results = [None] * len(locations)
+    missing = {}  # cache key -> indexes in locations
+
+    for i, (latitude, longitude) in enumerate(locations):
+        try:
+            key = _cache_key(latitude, longitude)
+        except (TypeError, ValueError):
+            results[i] = "Error fetching weather data"
+            continue
+        cached = _forecast_cache.get(key)
+        if cached and now - cached[0] < FORECAST_TTL:
+            results[i] = cached[1]
+        else:
+            missing.setdefault(key, []).append(i)
+
+    keys = list(missing)
+    batches = [keys[i:i + MAX_LOCATIONS_PER_REQUEST] for i in range(0, len(keys), MAX_LOCATIONS_PER_REQUEST)]
+    fetched = await asyncio.gather(*(_fetch_forecasts(batch) for batch in batches))
+
+    for batch, forecasts in zip(batches, fetched):
+        for key, forecast in zip(batch, forecasts):
+            if forecast is None:
+                forecast = "Error fetching weather data"
+            else:
+                _cache_forecast(key, forecast, now)
+            for i in missing[key]:
+                results[i] = forecast
+
+    return results